@@ -1,12 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, abort, send_file, get_template_attribute
+from markupsafe import Markup
+from flask.cli import AppGroup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import os
 import datetime
 from dotenv import load_dotenv
-from models import db, User, Book, Bookmark, ReadingProgress
-from book_handlers import get_book_content, get_book_toc, get_book_toc_positions, get_supported_formats
+from models import db, User, Book, Bookmark, ReadingProgress, ReadingEvent, DailyReading, upgrade_schema, sqlite_engine_options, enable_sqlite_tuning
+from book_handlers import get_book_content, get_book_toc, get_book_toc_positions, get_supported_formats, remove_book_artifacts, get_book_pages, prefetch_pages, CONTENT_VERSION, PAGE_SCHEME
+from book_cache import cache as book_cache, file_identity
+from ingest import submit_ingest, ensure_ingested
+from progress_buffer import progress_buffer
+from reading_stats import stats_rollup, get_user_stats, format_duration
+from search_index import search_index
+from shared_cache import shared_cache
+from storage import stage_upload, store_staged, object_lock
+from metrics import metrics
+from compression import compressor
+from covers import covers, COVER_SIZES, COVER_FORMATS
+from user_cache import user_cache
+from bulk_import import bulk_importer, FINAL_STATUSES
+import maintenance
+from sync import sync_hub, apply_changes, get_changes, decode_cursor, bookmark_dict
 import json
+import click
 import random
+import hashlib
+import base64
 from werkzeug.utils import secure_filename
 
 # 加载环境变量
@@ -16,15 +35,81 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_key_for_reader')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///reader.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_TUNING'] = os.getenv('SQLITE_TUNING', '0') == '1'  # 启用WAL等SQLite调优
+if app.config['SQLITE_TUNING'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(
+        busy_timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', 5)),
+        pool_size=int(os.getenv('SQLITE_POOL_SIZE', 10)),
+    )
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB 文件上传限制
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 1024)) * 1024 * 1024  # 文件上传大小限制，默认1GB
+app.config['BOOK_CACHE_MAX_BYTES'] = int(os.getenv('BOOK_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 已解析书籍缓存预算
+app.config['PAGE_CACHE_MAX_AGE'] = int(os.getenv('PAGE_CACHE_MAX_AGE', 3600))  # 页面内容在浏览器中的缓存时间（秒）
+app.config['PAGE_RANGE_MAX'] = int(os.getenv('PAGE_RANGE_MAX', 10))  # 批量获取页面时单次最多返回的页数
+app.config['LIBRARY_PAGE_SIZE'] = int(os.getenv('LIBRARY_PAGE_SIZE', 24))  # 书库每页显示的书籍数
+app.config['PROGRESS_FLUSH_INTERVAL'] = float(os.getenv('PROGRESS_FLUSH_INTERVAL', 5))  # 阅读进度批量写入间隔（秒）
+app.config['PROGRESS_FLUSH_MAX_PENDING'] = int(os.getenv('PROGRESS_FLUSH_MAX_PENDING', 500))  # 积压达到该数量时立即写入
+app.config['STATS_ROLLUP_INTERVAL'] = float(os.getenv('STATS_ROLLUP_INTERVAL', 60))  # 汇总阅读事件的间隔（秒），0为关闭后台汇总
+app.config['READING_SESSION_GAP'] = int(os.getenv('READING_SESSION_GAP', 120))  # 相邻两次进度保存超过该间隔（秒）视为新的阅读会话
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 300))  # 登录用户信息的缓存时间（秒），0为关闭
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))  # 缓存的最多用户数
+app.config['SYNC_STREAM_TIMEOUT'] = float(os.getenv('SYNC_STREAM_TIMEOUT', 300))  # 进度推送连接的最长保持时间（秒），0为关闭推送
+app.config['SYNC_HEARTBEAT'] = float(os.getenv('SYNC_HEARTBEAT', 15))  # 推送连接空闲时发送心跳的间隔（秒）
+
+# 配置已解析书籍缓存
+book_cache.configure(max_bytes=app.config['BOOK_CACHE_MAX_BYTES'])
+
+app.config['SEARCH_DB'] = os.getenv('SEARCH_DB', os.path.join(app.config['UPLOAD_FOLDER'], 'search.db'))  # 全文索引数据库
+app.config['SEARCH_RESULTS_LIMIT'] = int(os.getenv('SEARCH_RESULTS_LIMIT', 50))  # 单次搜索返回的最多结果数
+app.config['SHARED_CACHE_DB'] = os.getenv('SHARED_CACHE_DB', os.path.join(app.config['UPLOAD_FOLDER'], 'page_cache.db'))  # 多进程共享的页面缓存
+app.config['SHARED_CACHE_MAX_BYTES'] = int(os.getenv('SHARED_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 共享缓存大小上限，0为关闭
+app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', 0))  # 超过该耗时的请求记录分阶段日志，0为关闭
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # 访问 /metrics 的Bearer令牌，未设置时只按来源地址限制
+app.config['METRICS_ALLOWED_IPS'] = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1')  # 允许访问 /metrics 的地址或网段，逗号分隔，留空为不按地址放行
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # 超过该字节数的HTML/JSON响应才压缩
+app.config['STATIC_MAX_AGE'] = int(os.getenv('STATIC_MAX_AGE', 365 * 24 * 3600))  # 带指纹的静态文件缓存时间（秒）
+app.config['STATIC_CACHE_FOLDER'] = os.getenv('STATIC_CACHE_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], 'static_cache'))  # 预压缩静态文件的存放目录
+app.config['COVER_FOLDER'] = os.getenv('COVER_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], 'covers'))  # 封面缩略图的存放目录
+app.config['COVER_WORKERS'] = int(os.getenv('COVER_WORKERS', 2))  # 生成封面的线程数
+app.config['COVER_FONT'] = os.getenv('COVER_FONT')  # 占位封面绘制书名使用的TrueType字体，未设置时只绘制格式名称
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 4))  # 批量导入时同时处理的书籍数
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 初始化全文索引
+search_index.init_app(app)
+
+# 初始化多进程共享的页面缓存
+shared_cache.init_app(app)
+
 # 初始化数据库
 db.init_app(app)
 
+# 初始化阅读进度写回缓冲
+progress_buffer.init_app(app)
+
+# 初始化阅读统计的后台汇总
+stats_rollup.init_app(app)
+
+# 初始化请求耗时统计
+metrics.init_app(app)
+
+# 初始化响应压缩，启动时预压缩静态文件
+compressor.init_app(app)
+
+# 初始化封面生成
+covers.init_app(app)
+
+# 初始化登录用户缓存
+user_cache.init_app(app)
+
+# 初始化进度和书签的推送
+sync_hub.init_app(app)
+
+# 初始化批量导入
+bulk_importer.init_app(app)
+
 # 初始化登录管理器
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -32,7 +117,116 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # 每个请求都会加载用户，使用缓存的轻量用户，避免每次查询user表
+    return user_cache.get(int(user_id))
+
+def _page_etag(book, *parts):
+    """根据书籍文件内容哈希（旧数据使用mtime和大小）和请求的位置生成强ETag，文件不存在时返回None"""
+    identity = file_identity(book.file_path)
+    if identity is None:
+        return None
+    source = (book.content_hash,) if book.content_hash else identity[1:]
+    raw = ':'.join(str(part) for part in (book.id, CONTENT_VERSION) + source + parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _cacheable(response, etag):
+    """为页面内容响应设置ETag和私有缓存头"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['PAGE_CACHE_MAX_AGE']
+    # 同一URL的完整页面和AJAX响应不同
+    response.vary.add('X-Requested-With')
+    return response
+
+def _prefetch_neighbors(book, content):
+    """后台预读当前页前后相邻的页面"""
+    if not isinstance(content, dict) or 'error' in content:
+        return
+    current = content.get('position', 0)
+    total = content.get('total_positions', 1)
+    neighbors = [p for p in (current + 1, current - 1) if 0 <= p < total]
+    prefetch_pages(book.file_path, book.file_format, neighbors)
+
+# 阅读页外壳中按请求填充的部分：占位名 -> reader_slots.html 中的宏
+READER_SLOTS = {
+    'reader.html': {'page': 'page'},
+    'reader_pdf.html': {'page_nav': 'pdf_nav', 'page': 'pdf_page'},
+}
+
+def _shell_slot(name):
+    return f'<!--reader-slot:{name}-->'
+
+def _render_reader(template, book, position, total_positions, content_html):
+    """渲染完整阅读页
+
+    目录和页面框架只与书籍有关，渲染一次后放入书籍缓存，随书籍文件一起失效；
+    每次请求只渲染当前页内容、页码和翻页按钮，再填入外壳。
+    """
+    slots = READER_SLOTS[template]
+    
+    def render_shell(file_path=None):
+        # 目录只在完整页面中使用，AJAX翻页不需要
+        with metrics.stage('toc_build'):
+            toc = get_book_toc(book.file_path, book.file_format)
+            toc_positions = get_book_toc_positions(book.file_path, book.file_format)
+        placeholders = {name: Markup(_shell_slot(name)) for name in slots}
+        return render_template(template,
+                               book=book,
+                               toc=toc,
+                               toc_positions=toc_positions,
+                               total_positions=total_positions,
+                               today=Markup(_shell_slot('today')),
+                               **placeholders)
+    
+    # 有待显示的提示消息时外壳内容不同，不使用缓存
+    if session.get('_flashes'):
+        shell = render_shell()
+    else:
+        try:
+            shell = book_cache.get_or_load(f'reader_shell:{template}:{book.id}:{total_positions}',
+                                           book.file_path, render_shell,
+                                           sizer=lambda html: len(html.encode('utf-8')))
+        except FileNotFoundError:
+            shell = render_shell()
+    
+    fills = {'today': datetime.datetime.now().strftime('%Y-%m-%d')}
+    for name, macro in slots.items():
+        fills[name] = get_template_attribute('reader_slots.html', macro)(
+            book, position, total_positions, content_html)
+    for name, value in fills.items():
+        shell = shell.replace(_shell_slot(name), str(value))
+    return shell
+
+def _runtime_metrics():
+    """书籍缓存、共享缓存、用户缓存、进度缓冲和同步推送的计数，供 /metrics 输出"""
+    cache_stats = book_cache.stats()
+    progress_stats = progress_buffer.stats()
+    shared_stats = shared_cache.stats()
+    user_stats = user_cache.stats()
+    sync_stats = sync_hub.stats()
+    return [
+        ('reader_book_cache_hits_total', 'counter', '书籍缓存命中次数', cache_stats['hits']),
+        ('reader_book_cache_misses_total', 'counter', '书籍缓存未命中次数', cache_stats['misses']),
+        ('reader_book_cache_evictions_total', 'counter', '书籍缓存淘汰次数', cache_stats['evictions']),
+        ('reader_book_cache_entries', 'gauge', '书籍缓存条目数', cache_stats['entries']),
+        ('reader_book_cache_bytes', 'gauge', '书籍缓存占用字节数', cache_stats['bytes']),
+        ('reader_shared_cache_hits_total', 'counter', '共享页面缓存命中次数（本进程）', shared_stats['hits']),
+        ('reader_shared_cache_misses_total', 'counter', '共享页面缓存未命中次数（本进程）', shared_stats['misses']),
+        ('reader_shared_cache_bytes', 'gauge', '共享页面缓存占用字节数', shared_stats['bytes']),
+        ('reader_user_cache_hits_total', 'counter', '登录用户缓存命中次数', user_stats['hits']),
+        ('reader_user_cache_misses_total', 'counter', '登录用户缓存未命中次数', user_stats['misses']),
+        ('reader_user_cache_entries', 'gauge', '登录用户缓存条目数', user_stats['entries']),
+        ('reader_progress_pending', 'gauge', '尚未写入数据库的阅读进度数', progress_stats['pending']),
+        ('reader_progress_received_total', 'counter', '收到的进度保存次数', progress_stats['received']),
+        ('reader_progress_written_total', 'counter', '写入数据库的进度行数', progress_stats['written']),
+        ('reader_progress_flushes_total', 'counter', '进度批量写入次数', progress_stats['flushes']),
+        ('reader_progress_coalescing_ratio', 'gauge', '已写入批次中收到的保存次数与写入行数之比', progress_stats['coalescing_ratio']),
+        ('reader_sync_stream_connections', 'gauge', '进度推送连接数（本进程）', sync_stats['connections']),
+        ('reader_sync_events_published_total', 'counter', '推送的同步事件数', sync_stats['published']),
+        ('reader_sync_events_dropped_total', 'counter', '推送队列已满丢弃的同步事件数', sync_stats['dropped']),
+    ]
+
+metrics.register_collector(_runtime_metrics)
 
 # 路由：首页
 @app.route('/')
@@ -83,12 +277,131 @@ def logout():
     logout_user()
     return redirect(url_for('index'))
 
+# 书库排序方式：最近阅读、添加时间、书名
+LIBRARY_SORTS = ('recent', 'added', 'title')
+LIBRARY_MAX_LIMIT = 100
+
+def _encode_cursor(sort, value, book_id):
+    raw = json.dumps([sort, value, book_id], default=lambda v: v.isoformat())
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor, sort):
+    """解析分页游标，返回 (排序值, 书籍id)，无效时抛出ValueError"""
+    try:
+        cursor_sort, value, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('无效的分页参数')
+    if cursor_sort != sort or not isinstance(book_id, int) or isinstance(book_id, bool):
+        raise ValueError('无效的分页参数')
+    if sort == 'recent' and value is not None:
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError('无效的分页参数')
+    elif sort == 'title' and not isinstance(value, str):
+        raise ValueError('无效的分页参数')
+    return value, book_id
+
+def _library_page(user_id, sort='recent', cursor=None, limit=24):
+    """按游标分页查询书库，一次联表查询同时取出阅读进度"""
+    query = db.session.query(Book, ReadingProgress.position).outerjoin(
+        ReadingProgress,
+        db.and_(ReadingProgress.book_id == Book.id, ReadingProgress.user_id == user_id)
+    ).filter(Book.user_id == user_id)
+    
+    rows = []
+    after = _decode_cursor(cursor, sort) if cursor else None
+    if sort == 'title':
+        order = (Book.title.asc(), Book.id.asc())
+        if after:
+            title, book_id = after
+            query = query.filter(db.or_(Book.title > title,
+                                        db.and_(Book.title == title, Book.id > book_id)))
+    elif sort == 'added':
+        # id随上传递增，与添加时间顺序一致
+        order = (Book.id.desc(),)
+        if after:
+            query = query.filter(Book.id < after[1])
+    else:
+        # 最近阅读在前，从未阅读的排在最后；分两段按索引顺序读取：
+        # 先按 (last_read_at, id) 定位读取已阅读的书，不足一页时再按id读取未阅读的书
+        if not after or after[0] is not None:
+            read = query.filter(Book.last_read_at.isnot(None))
+            if after:
+                read = read.filter(db.tuple_(Book.last_read_at, Book.id) < tuple(after))
+            rows = read.order_by(Book.last_read_at.desc(), Book.id.desc()).limit(limit + 1).all()
+        order = (Book.id.desc(),)
+        query = query.filter(Book.last_read_at.is_(None))
+        if after and after[0] is None:
+            query = query.filter(Book.id < after[1])
+    
+    if len(rows) <= limit:
+        rows += query.order_by(*order).limit(limit + 1 - len(rows)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    books = []
+    for book, position in rows:
+        # 旧数据没有封面时在后台补充生成，生成失败的不再重复提交
+        if book.cover_path is None and book.status != Book.STATUS_PROCESSING:
+            covers.submit(book.id)
+        # 尚未写入数据库的最新进度优先
+        buffered = progress_buffer.get(user_id, book.id)
+        if buffered is not None:
+            position = buffered
+        percentage = None
+        if position is not None and book.total_positions:
+            percentage = min(100, round((position + 1) * 100 / book.total_positions))
+        books.append({
+            'id': book.id,
+            'title': book.title,
+            'file_format': book.file_format,
+            'cover_path': book.cover_path,
+            'cover_url': url_for('book_cover', size=COVER_SIZES[0], digest=book.cover_path, ext='webp')
+                         if book.cover_path else None,
+            'status': book.status,
+            'added_at': book.added_at.isoformat() if book.added_at else None,
+            'last_read_at': book.last_read_at.isoformat() if book.last_read_at else None,
+            'position': position,
+            'total_positions': book.total_positions,
+            'percentage': percentage
+        })
+    
+    next_cursor = None
+    if has_more:
+        last = rows[-1][0]
+        value = {'recent': last.last_read_at, 'added': None, 'title': last.title}[sort]
+        next_cursor = _encode_cursor(sort, value, last.id)
+    return books, next_cursor
+
+def _library_args():
+    sort = request.args.get('sort', 'recent')
+    if sort not in LIBRARY_SORTS:
+        sort = 'recent'
+    limit = request.args.get('limit', app.config['LIBRARY_PAGE_SIZE'], type=int)
+    return sort, request.args.get('cursor') or None, max(1, min(limit, LIBRARY_MAX_LIMIT))
+
 # 路由：图书库
 @app.route('/library')
 @login_required
 def library():
-    books = Book.query.filter_by(user_id=current_user.id).all()
-    return render_template('library.html', books=books)
+    sort, cursor, limit = _library_args()
+    try:
+        books, next_cursor = _library_page(current_user.id, sort, cursor, limit)
+    except ValueError:
+        return redirect(url_for('library', sort=sort))
+    return render_template('library.html', books=books, sort=sort,
+                           cursor=cursor, next_cursor=next_cursor)
+
+@app.route('/api/library')
+@login_required
+def library_api():
+    sort, cursor, limit = _library_args()
+    try:
+        books, next_cursor = _library_page(current_user.id, sort, cursor, limit)
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数错误'})
+    return jsonify({'success': True, 'sort': sort, 'books': books, 'next_cursor': next_cursor})
 
 # 路由：上传书籍
 @app.route('/upload', methods=['GET', 'POST'])
@@ -99,11 +412,20 @@ def upload_book():
             flash('没有文件')
             return redirect(request.url)
         
-        file = request.files['book']
-        if file.filename == '':
+        files = [f for f in request.files.getlist('book') if f.filename]
+        if not files:
             flash('没有选择文件')
             return redirect(request.url)
         
+        # 多个文件或zip压缩包转为批量导入，在后台并发处理
+        file = files[0]
+        if len(files) > 1 or os.path.splitext(file.filename)[1].lower() == '.zip':
+            job = bulk_importer.start(current_user.id)
+            for f in files:
+                bulk_importer.add(job, f.filename, f.stream)
+            flash(f'已开始批量导入 {len(files)} 个文件，正在后台处理')
+            return redirect(url_for('library'))
+        
         # 检查文件格式
         supported_formats = get_supported_formats()
         file_ext = os.path.splitext(file.filename)[1].lower()
@@ -112,25 +434,97 @@ def upload_book():
             flash(f'不支持的文件格式，支持的格式有: {", ".join(supported_formats)}')
             return redirect(request.url)
         
-        # 保存文件
-        filename = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(filename)
+        # 按内容哈希分块保存文件，相同内容只存一份
+        folder = app.config['UPLOAD_FOLDER']
+        tmp_path, content_hash = stage_upload(file.stream, folder)
         
-        # 添加到数据库
-        new_book = Book(
-            title=os.path.splitext(file.filename)[0],
-            file_path=filename,
-            file_format=file_ext,
-            user_id=current_user.id
-        )
-        db.session.add(new_book)
-        db.session.commit()
+        # 放入存储和添加书籍记录在同一把锁内完成，不会与删除相同内容的书籍交错
+        with object_lock(folder):
+            filename = store_staged(tmp_path, folder, content_hash, file_ext)
+            new_book = Book(
+                title=os.path.splitext(file.filename)[0],
+                file_path=filename,
+                file_format=file_ext,
+                user_id=current_user.id,
+                content_hash=content_hash,
+                status=Book.STATUS_PROCESSING,
+                page_scheme=PAGE_SCHEME
+            )
+            
+            # 相同内容已处理完成时直接复用结果
+            existing = Book.query.filter_by(file_path=filename, status=Book.STATUS_READY,
+                                            page_scheme=PAGE_SCHEME).first()
+            if existing is not None:
+                new_book.status = Book.STATUS_READY
+                new_book.total_positions = existing.total_positions
+            
+            db.session.add(new_book)
+            db.session.commit()
         
-        flash('书籍上传成功')
+        # 后台预处理，上传请求立即返回；已处理过的文件只需生成封面
+        if new_book.status == Book.STATUS_PROCESSING:
+            submit_ingest(app, new_book.id)
+        else:
+            covers.submit(new_book.id)
+        
+        flash('书籍上传成功，正在后台处理')
         return redirect(url_for('library'))
     
     return render_template('upload.html')
 
+# 路由：批量导入多个文件或zip压缩包
+@app.route('/api/import', methods=['POST'])
+@login_required
+def bulk_import():
+    files = [f for f in request.files.getlist('books') if f.filename]
+    if not files:
+        return jsonify({'success': False, 'message': '没有文件'})
+    
+    job = bulk_importer.start(current_user.id)
+    for f in files:
+        bulk_importer.add(job, f.filename, f.stream)
+    return jsonify({'success': True, 'job_id': job.id,
+                    'status_url': url_for('bulk_import_status', job_id=job.id)})
+
+# 路由：批量导入进度
+@app.route('/api/import/<job_id>')
+@login_required
+def bulk_import_status(job_id):
+    # 导入进度只保存在处理该导入的进程中
+    job = bulk_importer.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return jsonify({'success': True, **job.to_dict()})
+
+# 路由：封面缩略图
+@app.route('/covers/<int:size>/<digest>.<ext>')
+@login_required
+def book_cover(size, digest, ext):
+    # 缩略图按内容哈希命名，内容不会变化，可以长期缓存
+    if size not in COVER_SIZES or ext not in COVER_FORMATS or len(digest) != 64 \
+            or any(c not in '0123456789abcdef' for c in digest):
+        abort(404)
+    path = covers.path(digest, size, ext)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype=COVER_FORMATS[ext][1], conditional=True)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['STATIC_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+# 上传文件超过大小限制
+@app.errorhandler(413)
+def upload_too_large(e):
+    message = f'文件过大，最大支持 {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)}MB'
+    # 接口请求返回JSON错误，页面上传跳回上传页
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    if request.path.startswith('/api/') or wants_json:
+        return jsonify({'success': False, 'message': message}), 413
+    flash(message)
+    return redirect(url_for('upload_book'))
+
 # 路由：阅读书籍
 @app.route('/read/<int:book_id>')
 @app.route('/read/<int:book_id>/<int:position>')
@@ -150,31 +544,43 @@ def read_book(book_id, position=None):
         flash('没有权限访问此书籍')
         return redirect(url_for('library'))
     
-    # 获取阅读进度
-    progress = ReadingProgress.query.filter_by(
-        user_id=current_user.id, book_id=book_id
-    ).first()
+    # 旧书籍补充后台预处理，分页方案变化时先转换已保存的进度和书签
+    ensure_ingested(app, book)
     
-    # 如果没有指定位置，使用保存的进度
+    # 如果没有指定位置，使用保存的进度（优先使用尚未写入数据库的最新进度）
     if position is None:
         position = 0
-        if progress:
-            position = progress.position
+        buffered = progress_buffer.get(current_user.id, book_id)
+        if buffered is not None:
+            position = buffered
+        else:
+            progress = ReadingProgress.query.filter_by(
+                user_id=current_user.id, book_id=book_id
+            ).first()
+            if progress:
+                position = progress.position
+    
+    # AJAX翻页：内容未变化时直接返回304，不读取书籍
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    etag = _page_etag(book, 'page', position) if is_ajax else None
+    if etag and request.if_none_match.contains_weak(etag):
+        return _cacheable(app.response_class(status=304), etag)
     
-    # 获取书籍内容
-    content = get_book_content(book.file_path, book.file_format, position)
-    toc = get_book_toc(book.file_path, book.file_format)
-    toc_positions = get_book_toc_positions(book.file_path, book.file_format)
+    # 获取书籍内容，并预读相邻页面
+    with metrics.stage('book_parse'):
+        content = get_book_content(book.file_path, book.file_format, position)
+    _prefetch_neighbors(book, content)
     
     # 处理AJAX请求
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+    if is_ajax:
         try:
-            return jsonify({
+            response = jsonify({
                 'success': True,
                 'content': content['content'] if isinstance(content, dict) else content,
                 'position': content['position'] if isinstance(content, dict) and 'position' in content else position,
                 'total_positions': content['total_positions'] if isinstance(content, dict) and 'total_positions' in content else 1
             })
+            return _cacheable(response, etag) if etag else response
         except Exception as e:
             app.logger.error(f"AJAX处理错误: {str(e)}")
             return jsonify({
@@ -196,14 +602,8 @@ def read_book(book_id, position=None):
         current_position = position
         total_positions = 1
     
-    return render_template('reader.html', 
-                          book=book, 
-                          content=content_html, 
-                          toc=toc, 
-                          toc_positions=toc_positions,
-                          position=current_position,
-                          total_positions=total_positions,
-                          now=datetime.datetime.now())
+    # 目录和页面框架按书籍缓存，只填充当前页
+    return _render_reader('reader.html', book, current_position, total_positions, content_html)
 
 
 @app.route('/read/pdf-<int:book_id>')
@@ -217,31 +617,43 @@ def read_book_pdf(book_id, position=None):
         flash('没有权限访问此书籍')
         return redirect(url_for('library'))
     
-    # 获取阅读进度
-    progress = ReadingProgress.query.filter_by(
-        user_id=current_user.id, book_id=book_id
-    ).first()
+    # 旧书籍补充后台预处理，分页方案变化时先转换已保存的进度和书签
+    ensure_ingested(app, book)
     
-    # 如果没有指定位置，使用保存的进度
+    # 如果没有指定位置，使用保存的进度（优先使用尚未写入数据库的最新进度）
     if position is None:
         position = 0
-        if progress:
-            position = progress.position
+        buffered = progress_buffer.get(current_user.id, book_id)
+        if buffered is not None:
+            position = buffered
+        else:
+            progress = ReadingProgress.query.filter_by(
+                user_id=current_user.id, book_id=book_id
+            ).first()
+            if progress:
+                position = progress.position
     
-    # 获取书籍内容
-    content = get_book_content(book.file_path, book.file_format, position)
-    toc = get_book_toc(book.file_path, book.file_format)
-    toc_positions = get_book_toc_positions(book.file_path, book.file_format)
+    # AJAX翻页：内容未变化时直接返回304，不读取书籍
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    etag = _page_etag(book, 'page', position) if is_ajax else None
+    if etag and request.if_none_match.contains_weak(etag):
+        return _cacheable(app.response_class(status=304), etag)
+    
+    # 获取书籍内容，并预读相邻页面
+    with metrics.stage('book_parse'):
+        content = get_book_content(book.file_path, book.file_format, position)
+    _prefetch_neighbors(book, content)
     
     # 处理AJAX请求
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+    if is_ajax:
         try:
-            return jsonify({
+            response = jsonify({
                 'success': True,
                 'content': content['content'] if isinstance(content, dict) else content,
                 'position': content['position'] if isinstance(content, dict) and 'position' in content else position,
                 'total_positions': content['total_positions'] if isinstance(content, dict) and 'total_positions' in content else 1
             })
+            return _cacheable(response, etag) if etag else response
         except Exception as e:
             app.logger.error(f"AJAX处理错误: {str(e)}")
             return jsonify({
@@ -263,16 +675,87 @@ def read_book_pdf(book_id, position=None):
         current_position = position
         total_positions = 1
     
-    return render_template('reader_pdf.html', 
-                          book=book, 
-                          content=content_html, 
-                          toc=toc, 
-                          toc_positions=toc_positions,
-                          position=current_position,
-                          total_positions=total_positions,
-                          now=datetime.datetime.now())
+    # 目录和页面框架按书籍缓存，只填充当前页
+    return _render_reader('reader_pdf.html', book, current_position, total_positions, content_html)
 
 
+# 路由：批量获取连续页面
+@app.route('/api/books/<int:book_id>/pages')
+@login_required
+def book_pages(book_id):
+    book = Book.query.get_or_404(book_id)
+    if book.user_id != current_user.id:
+        return jsonify({'success': False, 'message': '没有权限'})
+    
+    start = max(0, request.args.get('from', 0, type=int))
+    count = request.args.get('count', 1, type=int)
+    count = max(1, min(count, app.config['PAGE_RANGE_MAX']))
+    
+    etag = _page_etag(book, 'range', start, count)
+    if etag and request.if_none_match.contains_weak(etag):
+        return _cacheable(app.response_class(status=304), etag)
+    
+    with metrics.stage('book_parse'):
+        result = get_book_pages(book.file_path, book.file_format, start, count)
+    if 'error' in result:
+        return jsonify({'success': False, 'error': result['error']}), 500
+    
+    # 预读返回范围之后的下一页
+    next_position = start + len(result['pages'])
+    if next_position < result['total_positions']:
+        prefetch_pages(book.file_path, book.file_format, [next_position])
+    
+    response = jsonify({
+        'success': True,
+        'from': start,
+        'total_positions': result['total_positions'],
+        'pages': [{
+            'position': page['position'],
+            'title': page.get('title'),
+            'content': page['content']
+        } for page in result['pages']]
+    })
+    return _cacheable(response, etag) if etag else response
+
+def _search_library(query):
+    """在当前用户的全部书籍中检索，返回带书籍信息的结果列表"""
+    books_by_path = {}
+    for book in Book.query.filter_by(user_id=current_user.id).all():
+        books_by_path.setdefault(book.file_path, []).append(book)
+    
+    results = []
+    hits = search_index.search(books_by_path.keys(), query, limit=app.config['SEARCH_RESULTS_LIMIT'])
+    for doc, position, title, snippet in hits:
+        for book in books_by_path.get(doc, []):
+            results.append({
+                'book_id': book.id,
+                'book_title': book.title,
+                'position': position,
+                'title': title,
+                'snippet': snippet,
+                'url': url_for('read_book', book_id=book.id, position=position)
+            })
+    return results
+
+# 路由：全文搜索
+@app.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    results = _search_library(query) if query else []
+    return render_template('search.html', query=query, results=results,
+                           search_enabled=search_index.enabled)
+
+@app.route('/api/search')
+@login_required
+def search_api():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': '参数错误'})
+    if not search_index.enabled:
+        return jsonify({'success': False, 'message': '全文搜索不可用'})
+    return jsonify({'success': True, 'query': query, 'results': _search_library(query)})
+
 # 路由：保存阅读进度
 @app.route('/save_progress', methods=['POST'])
 @login_required
@@ -283,27 +766,18 @@ def save_progress():
     if not book_id or position is None:
         return jsonify({'success': False, 'message': '参数错误'})
     
-    # 检查书籍是否存在且属于当前用户
-    book = Book.query.get_or_404(book_id)
-    if book.user_id != current_user.id:
+    # 检查书籍是否存在且属于当前用户，只查询所属用户
+    owner_id = db.session.query(Book.user_id).filter_by(id=book_id).scalar()
+    if owner_id is None:
+        abort(404)
+    if owner_id != current_user.id:
         return jsonify({'success': False, 'message': '没有权限'})
     
-    # 更新或创建阅读进度
-    progress = ReadingProgress.query.filter_by(
-        user_id=current_user.id, book_id=book_id
-    ).first()
-    
-    if progress:
-        progress.position = position
-    else:
-        progress = ReadingProgress(
-            user_id=current_user.id,
-            book_id=book_id,
-            position=position
-        )
-        db.session.add(progress)
-    
-    db.session.commit()
+    # 写入缓冲，由后台批量写入数据库
+    progress_buffer.add(current_user.id, book_id, position)
+    sync_hub.publish(current_user.id, 'progress', {
+        'book_id': book_id, 'position': position, 'updated_at': datetime.datetime.utcnow().isoformat()
+    }, source=request.form.get('client_id'))
     return jsonify({'success': True})
 
 # 路由：添加书签
@@ -331,6 +805,7 @@ def add_bookmark():
     )
     db.session.add(bookmark)
     db.session.commit()
+    _publish_bookmark(bookmark)
     
     return jsonify({'success': True, 'id': bookmark.id})
 
@@ -339,7 +814,7 @@ def add_bookmark():
 @login_required
 def get_bookmarks(book_id):
     bookmarks = Bookmark.query.filter_by(
-        user_id=current_user.id, book_id=book_id
+        user_id=current_user.id, book_id=book_id, deleted=False
     ).all()
     
     result = []
@@ -363,11 +838,53 @@ def delete_bookmark(bookmark_id):
     if bookmark.user_id != current_user.id:
         return jsonify({'success': False, 'message': '没有权限'})
     
-    db.session.delete(bookmark)
+    # 保留删除标记，其他设备同步时才能得知删除
+    bookmark.deleted = True
     db.session.commit()
+    _publish_bookmark(bookmark)
     
     return jsonify({'success': True})
 
+def _publish_bookmark(bookmark):
+    sync_hub.publish(current_user.id, 'bookmark', bookmark_dict(bookmark),
+                     source=request.form.get('client_id'))
+
+# 路由：批量同步阅读进度和书签
+@app.route('/api/sync', methods=['POST'])
+@login_required
+def sync_changes():
+    # 一次请求提交本地积累的修改，并取回游标之后的所有变化
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': '参数错误'})
+    book_id = data.get('book_id')
+    try:
+        if book_id is not None and (not isinstance(book_id, int) or isinstance(book_id, bool)):
+            raise ValueError('无效的书籍id')
+        since = decode_cursor(data['cursor']) if data.get('cursor') else None
+        results = apply_changes(current_user.id, data.get('changes') or [],
+                                client_now=data.get('client_now'), source=data.get('client_id'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'参数错误: {e}'})
+    
+    changes = get_changes(current_user.id, since, book_id)
+    return jsonify({'success': True, 'results': results, **changes})
+
+# 路由：推送同一用户其他会话的进度和书签变化
+@app.route('/api/sync/stream')
+@login_required
+def sync_stream():
+    if not sync_hub.enabled:
+        abort(404)
+    response = app.response_class(
+        sync_hub.stream(current_user.id, request.args.get('client_id')),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭反向代理的响应缓冲
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # 路由：切换主题
 @app.route('/toggle_theme', methods=['POST'])
 def toggle_theme():
@@ -386,14 +903,16 @@ def profile():
 @app.route('/reading_stats')
 @login_required
 def reading_stats():
-    # 计算总阅读时间、阅读书籍数量等
+    # 阅读时长和会话数来自后台汇总的统计表，不扫描原始事件
     total_books = Book.query.filter_by(user_id=current_user.id).count()
-    total_progress = ReadingProgress.query.filter_by(user_id=current_user.id).count()
+    stats = get_user_stats(current_user.id)
     
     return jsonify({
         'total_books': total_books,
-        'reading_sessions': total_progress,
-        'total_time': '15h 30m'  # 这里可以实际计算
+        'reading_sessions': stats['sessions'],
+        'total_time': format_duration(stats['total_seconds']),
+        'total_seconds': stats['total_seconds'],
+        'daily': stats['daily']
     })
 
 # 删除书籍
@@ -406,24 +925,120 @@ def delete_book(book_id):
         return jsonify({'success': False, 'message': '没有权限'})
     
     # 删除相关的书签和进度
-    Bookmark.query.filter_by(book_id=book_id).delete()
-    ReadingProgress.query.filter_by(book_id=book_id).delete()
+    progress_buffer.discard_book(book_id)
     
-    # 删除文件
-    try:
-        if os.path.exists(book.file_path):
-            os.remove(book.file_path)
-    except:
-        pass
+    # 检查引用、删除记录和删除文件在同一把锁内完成，相同内容的上传不会引用已删除的文件
+    with object_lock(app.config['UPLOAD_FOLDER']):
+        Bookmark.query.filter_by(book_id=book_id).delete()
+        ReadingProgress.query.filter_by(book_id=book_id).delete()
+        ReadingEvent.query.filter_by(book_id=book_id).delete()
+        DailyReading.query.filter_by(book_id=book_id).delete()
+        
+        shared = Book.query.filter(Book.file_path == book.file_path, Book.id != book.id).count()
+        # 没有其他书籍使用同一封面时删除缩略图
+        cover_shared = book.cover_path and Book.query.filter(Book.cover_path == book.cover_path,
+                                                             Book.id != book.id).count()
+        file_path, cover_path = book.file_path, book.cover_path
+        db.session.delete(book)
+        db.session.commit()
+        
+        # 没有其他书籍引用同一文件时，清除缓存、辅助文件和全文索引，再删除文件
+        if not shared:
+            remove_book_artifacts(file_path)
+            search_index.remove_book(file_path)
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            except OSError:
+                pass
     
-    db.session.delete(book)
-    db.session.commit()
+    if cover_path and not cover_shared:
+        covers.remove(cover_path)
     
     return jsonify({'success': True})
 
+# 命令行：批量导入本地文件、目录或zip压缩包
+@app.cli.command('import-books')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--user', 'username', required=True, help='导入到该用户的书库')
+def import_books_command(paths, username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'用户不存在: {username}')
+    
+    job = bulk_importer.start(user.id)
+    for path in paths:
+        bulk_importer.add_path(job, path)
+    
+    # 每个文件处理完成时输出结果
+    reported = set()
+    while True:
+        finished = job.wait(timeout=0.5)
+        items = job.to_dict()['items']
+        for index, item in enumerate(items):
+            if index in reported or item['status'] not in FINAL_STATUSES:
+                continue
+            reported.add(index)
+            suffix = f" (book {item['book_id']})" if item['book_id'] else ''
+            error = f": {item['error']}" if item['error'] else ''
+            click.echo(f"[{item['status']}] {item['name']}{suffix}{error}")
+        if finished and len(reported) == len(items):
+            break
+    
+    counts = job.to_dict()['counts']
+    click.echo(', '.join(f'{status}: {count}' for status, count in sorted(counts.items())))
+
+# 命令行：检查和生成书籍的派生数据（分块存储、目录、全文索引、封面）
+reader_cli = AppGroup('reader', help='检查和生成书籍的派生数据')
+app.cli.add_command(reader_cli)
+
+def _maintenance_options(command):
+    command = click.option('--artifact', 'artifacts', multiple=True, type=click.Choice(maintenance.ARTIFACTS),
+                           help='只处理指定的数据，可重复，默认全部')(command)
+    command = click.option('--book', 'book_ids', multiple=True, type=int, help='只处理指定id的书籍，可重复')(command)
+    command = click.option('--user', 'username', help='只处理该用户的书籍')(command)
+    command = click.option('--workers', type=int, help='工作进程数，默认为CPU核数')(command)
+    return command
+
+def _run_maintenance(mode, artifacts, book_ids, username, workers):
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'用户不存在: {username}')
+        user_id = user.id
+    counts = maintenance.run(app, mode, artifacts or maintenance.ARTIFACTS, book_ids=book_ids,
+                             user_id=user_id, workers=workers, echo=click.echo)
+    click.echo(', '.join(f'{state}: {count}' for state, count in sorted(counts.items())) or '没有书籍')
+    return counts
+
+@reader_cli.command('warm')
+@_maintenance_options
+def reader_warm_command(artifacts, book_ids, username, workers):
+    """生成缺失或过期的派生数据，已是最新的按文件身份跳过，中断后可重新运行继续"""
+    _run_maintenance(maintenance.MODE_WARM, artifacts, book_ids, username, workers)
+
+@reader_cli.command('reindex')
+@_maintenance_options
+def reader_reindex_command(artifacts, book_ids, username, workers):
+    """忽略已有数据，全部重新生成"""
+    _run_maintenance(maintenance.MODE_REBUILD, artifacts, book_ids, username, workers)
+
+@reader_cli.command('verify')
+@_maintenance_options
+def reader_verify_command(artifacts, book_ids, username, workers):
+    """只检查派生数据是否与书籍文件一致，有过期或缺失时返回非零退出码"""
+    counts = _run_maintenance(maintenance.MODE_VERIFY, artifacts, book_ids, username, workers)
+    if any(counts.get(state) for state in (maintenance.STALE, maintenance.FAILED, 'missing')):
+        raise SystemExit(1)
+
 # 创建数据库表
 with app.app_context():
+    if app.config['SQLITE_TUNING']:
+        enable_sqlite_tuning(db.engine)
+    metrics.instrument_engine(db.engine)
     db.create_all()
+    upgrade_schema()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
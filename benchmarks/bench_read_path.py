@@ -0,0 +1,275 @@
+"""阅读路径性能测试
+
+生成合成书籍，通过Flask测试客户端依次执行首次打开、顺序翻页、随机跳转、
+目录加载和保存进度等场景，输出各场景的延迟分位数、吞吐量和内存峰值。
+
+用法示例：
+    python benchmarks/bench_read_path.py --preset small --output result.json
+    python benchmarks/bench_read_path.py --txt-mb 50 --turns 500 --no-ingest
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRESETS = {
+    'small': {'epub_chapters': 20, 'epub_paragraphs': 20, 'pdf_pages': 50, 'txt_mb': 1.0},
+    'medium': {'epub_chapters': 100, 'epub_paragraphs': 40, 'pdf_pages': 300, 'txt_mb': 10.0},
+    'large': {'epub_chapters': 400, 'epub_paragraphs': 60, 'pdf_pages': 1000, 'txt_mb': 50.0},
+}
+
+AJAX = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_kb():
+    """进程启动以来的内存峰值（KB），无法获取时返回0"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 返回字节，Linux 返回KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def summarize(name, fmt, samples, elapsed):
+    values = sorted(samples)
+    ms = [v * 1000.0 for v in values]
+    return {
+        'scenario': name,
+        'format': fmt,
+        'count': len(values),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(ms[-1], 3) if ms else 0.0,
+        'throughput_ops': round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def timed(samples, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'请求失败: {response.status_code} {response.data[:200]!r}')
+    return response
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_ready(app, book_ids, timeout):
+    from models import Book, db
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with app.app_context():
+            statuses = {b.id: b.status for b in Book.query.filter(Book.id.in_(book_ids))}
+            db.session.remove()
+        if all(status != Book.STATUS_PROCESSING for status in statuses.values()):
+            return statuses
+        time.sleep(0.05)
+    raise RuntimeError('等待书籍预处理超时')
+
+
+def run(args):
+    work = tempfile.mkdtemp(prefix='reader-bench-')
+    # 必须在导入app之前设置，避免写入仓库中的数据库
+    os.environ['DATABASE_URI'] = 'sqlite:///' + os.path.join(work, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(work, 'uploads')
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from corpus import make_corpus
+    try:
+        params = dict(PRESETS[args.preset])
+        for key in params:
+            value = getattr(args, key)
+            if value is not None:
+                params[key] = value
+
+        start = time.perf_counter()
+        corpus = make_corpus(os.path.join(work, 'corpus'), seed=args.seed, **params)
+        corpus_seconds = time.perf_counter() - start
+        corpus = {fmt: path for fmt, path in corpus.items() if fmt in args.formats}
+
+        from app import app
+        from book_cache import cache as book_cache
+        from book_handlers import get_book_toc, get_book_toc_positions
+        from models import Book
+        from progress_buffer import progress_buffer
+
+        app.config['TESTING'] = True
+        client = app.test_client()
+        check(client.post('/register', data={'username': 'bench', 'password': 'bench'}))
+        check(client.post('/login', data={'username': 'bench', 'password': 'bench'}))
+
+        rng = random.Random(args.seed)
+        results = []
+        for fmt, path in corpus.items():
+            samples = []
+            upload_start = time.perf_counter()
+            with open(path, 'rb') as f:
+                timed(samples, lambda: check(client.post(
+                    '/upload', data={'book': (f, os.path.basename(path))},
+                    content_type='multipart/form-data')))
+            results.append(summarize('upload', fmt, samples, time.perf_counter() - upload_start))
+
+            with app.app_context():
+                book = Book.query.order_by(Book.id.desc()).first()
+                book_id, file_path, file_format = book.id, book.file_path, book.file_format
+
+            if args.no_ingest:
+                # 等待后台任务结束后删除分块存储，测量未预处理时的读取路径
+                wait_ready(app, [book_id], args.ingest_timeout)
+                from chunk_store import remove_store
+                remove_store(file_path)
+            else:
+                samples = []
+                ingest_start = time.perf_counter()
+                timed(samples, wait_ready, app, [book_id], args.ingest_timeout)
+                results.append(summarize('ingest_wait', fmt, samples, time.perf_counter() - ingest_start))
+            book_cache.clear()
+
+            # 首次打开：冷缓存下的完整阅读页面
+            samples = []
+            scenario_start = time.perf_counter()
+            timed(samples, lambda: check(client.get(f'/read/{book_id}/0')))
+            results.append(summarize('first_open', fmt, samples, time.perf_counter() - scenario_start))
+
+            total = client.get(f'/read/{book_id}/0', headers=AJAX).get_json()['total_positions']
+            turns = min(args.turns, max(total - 1, 1))
+
+            # 顺序翻页
+            samples = []
+            scenario_start = time.perf_counter()
+            for position in range(1, turns + 1):
+                timed(samples, lambda: check(client.get(f'/read/{book_id}/{position}', headers=AJAX)))
+            results.append(summarize('sequential_turns', fmt, samples, time.perf_counter() - scenario_start))
+
+            # 随机跳转
+            if args.cold:
+                book_cache.clear()
+            samples = []
+            scenario_start = time.perf_counter()
+            for _ in range(args.jumps):
+                position = rng.randrange(total) if total else 0
+                timed(samples, lambda: check(client.get(f'/read/{book_id}/{position}', headers=AJAX)))
+            results.append(summarize('random_jumps', fmt, samples, time.perf_counter() - scenario_start))
+
+            # 目录加载：处理函数层面和完整页面
+            if args.cold:
+                book_cache.clear()
+            samples = []
+            scenario_start = time.perf_counter()
+            for _ in range(args.toc_loads):
+                timed(samples, lambda: (get_book_toc(file_path, file_format),
+                                        get_book_toc_positions(file_path, file_format)))
+            results.append(summarize('toc_load', fmt, samples, time.perf_counter() - scenario_start))
+
+            samples = []
+            scenario_start = time.perf_counter()
+            for _ in range(args.page_loads):
+                position = rng.randrange(total) if total else 0
+                timed(samples, lambda: check(client.get(f'/read/{book_id}/{position}')))
+            results.append(summarize('full_page', fmt, samples, time.perf_counter() - scenario_start))
+
+            # 保存进度，最后统一写入数据库
+            samples = []
+            scenario_start = time.perf_counter()
+            for i in range(args.progress_saves):
+                timed(samples, lambda: check(client.post(
+                    '/save_progress', data={'book_id': book_id, 'position': i % max(total, 1)})))
+            timed(samples, progress_buffer.flush)
+            results.append(summarize('progress_save', fmt, samples, time.perf_counter() - scenario_start))
+
+        return {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'preset': args.preset,
+            'params': params,
+            'options': {
+                'turns': args.turns, 'jumps': args.jumps, 'toc_loads': args.toc_loads,
+                'page_loads': args.page_loads, 'progress_saves': args.progress_saves,
+                'no_ingest': args.no_ingest, 'cold': args.cold, 'seed': args.seed,
+            },
+            'corpus_seconds': round(corpus_seconds, 3),
+            'cache': book_cache.stats(),
+            'results': results,
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def print_table(report):
+    header = f"{'scenario':<18}{'fmt':<7}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'rss MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in report['results']:
+        print(f"{r['scenario']:<18}{r['format']:<7}{r['count']:>6}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_ops']:>10.1f}"
+              f"{r['peak_rss_kb'] / 1024:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='阅读路径性能测试')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--formats', default='.epub,.pdf,.txt',
+                        type=lambda s: [f if f.startswith('.') else '.' + f for f in s.split(',')])
+    parser.add_argument('--epub-chapters', dest='epub_chapters', type=int)
+    parser.add_argument('--epub-paragraphs', dest='epub_paragraphs', type=int)
+    parser.add_argument('--pdf-pages', dest='pdf_pages', type=int)
+    parser.add_argument('--txt-mb', dest='txt_mb', type=float)
+    parser.add_argument('--turns', type=int, default=100, help='顺序翻页次数')
+    parser.add_argument('--jumps', type=int, default=100, help='随机跳转次数')
+    parser.add_argument('--toc-loads', type=int, default=50)
+    parser.add_argument('--page-loads', type=int, default=20, help='完整页面渲染次数')
+    parser.add_argument('--progress-saves', type=int, default=200)
+    parser.add_argument('--no-ingest', action='store_true', help='删除分块存储，测量直接解析文件的路径')
+    parser.add_argument('--cold', action='store_true', help='每个场景前清空进程内缓存')
+    parser.add_argument('--ingest-timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='保留临时目录')
+    parser.add_argument('--output', help='将结果写入JSON文件')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_table(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""离线生成用于性能测试的EPUB、PDF、TXT书籍"""
+import os
+import random
+from ebooklib import epub
+
+# 生成正文使用的常用汉字
+_CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严'
+
+
+def _sentence(rng, length):
+    return ''.join(rng.choice(_CHARS) for _ in range(length)) + '。'
+
+
+def _paragraph(rng, sentences=6):
+    return ''.join(_sentence(rng, rng.randint(8, 24)) for _ in range(sentences))
+
+
+def make_epub(path, chapters=20, paragraphs=40, seed=0):
+    """生成带目录的EPUB，每章一个XHTML文档"""
+    rng = random.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier(f'bench-{chapters}-{paragraphs}-{seed}')
+    book.set_title('性能测试书籍')
+    book.set_language('zh')
+
+    items = []
+    for i in range(chapters):
+        chapter = epub.EpubHtml(title=f'第{i + 1}章', file_name=f'chap_{i:04d}.xhtml', lang='zh')
+        body = ''.join(f'<p>{_paragraph(rng)}</p>' for _ in range(paragraphs))
+        chapter.content = f'<h1>第{i + 1}章</h1>{body}'
+        book.add_item(chapter)
+        items.append(chapter)
+
+    book.toc = [epub.Link(item.file_name, item.title, f'c{i}') for i, item in enumerate(items)]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(path, book)
+    return path
+
+
+def make_pdf(path, pages=100, lines_per_page=30, seed=0):
+    """手工写出只含ASCII文本的PDF，不依赖额外的PDF生成库"""
+    rng = random.Random(seed)
+    words = ['reader', 'chapter', 'page', 'history', 'tang', 'dynasty', 'empire', 'river',
+             'mountain', 'emperor', 'general', 'poem', 'city', 'market', 'silk', 'road']
+
+    font_id = 3 + 2 * pages
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [{}] /Count {} >>'.format(
+            ' '.join(f'{3 + 2 * i} 0 R' for i in range(pages)), pages),
+    ]
+    for i in range(pages):
+        lines = [f'Page {i + 1}'] + [
+            ' '.join(rng.choice(words) for _ in range(10)) for _ in range(lines_per_page)
+        ]
+        ops = ['BT', '/F1 10 Tf', '14 TL', '50 760 Td']
+        ops += [f'({line}) Tj T*' for line in lines]
+        ops.append('ET')
+        stream = '\n'.join(ops)
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+            f'/Resources << /Font << /F1 {font_id} 0 R >> >> >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    for offset in offsets:
+        out += f'{offset:010d} 00000 n \n'.encode('latin-1')
+    out += (f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n'
+            f'startxref\n{xref}\n%%EOF\n').encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+
+def make_txt(path, megabytes=5.0, seed=0):
+    """生成指定大小的UTF-8文本，每行一段"""
+    rng = random.Random(seed)
+    target = int(megabytes * 1024 * 1024)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        line_no = 0
+        while written < target:
+            line = f'{line_no} {_paragraph(rng, rng.randint(1, 4))}\n'
+            f.write(line)
+            written += len(line.encode('utf-8'))
+            line_no += 1
+    return path
+
+
+def make_corpus(directory, epub_chapters=20, epub_paragraphs=40, pdf_pages=100, txt_mb=5.0, seed=0):
+    """在目录中生成三种格式的书籍，返回 {格式: 路径}"""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        '.epub': make_epub(os.path.join(directory, 'bench.epub'), epub_chapters, epub_paragraphs, seed=seed),
+        '.pdf': make_pdf(os.path.join(directory, 'bench.pdf'), pdf_pages, seed=seed),
+        '.txt': make_txt(os.path.join(directory, 'bench.txt'), txt_mb, seed=seed),
+    }
@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+
+# 默认缓存预算：256MB
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def file_identity(file_path):
+    """返回文件身份 (路径, mtime, 大小)，文件不存在时返回None"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (file_path, st.st_mtime_ns, st.st_size)
+
+
+class _Entry:
+    __slots__ = ('value', 'size')
+
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+
+
+class BookCache:
+    """按字节预算淘汰的LRU缓存，存放已打开/已解析的书籍对象
+
+    缓存键为 (kind, 文件路径, mtime, 大小)，文件被替换后旧条目自然失效。
+    淘汰或失效只从缓存中移除条目，不关闭对象：其他线程可能仍在使用，
+    文件句柄、mmap和数据库连接在最后一个使用者释放引用后由垃圾回收关闭。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # 文件路径 -> 该文件的全部缓存键，便于按文件失效
+        self._keys_by_path = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+    def configure(self, max_bytes=None):
+        """调整缓存预算，超出部分立即淘汰"""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict_over_budget()
+
+    def contains(self, kind, file_path):
+        """判断某个对象是否已在缓存中（不计入命中统计）"""
+        identity = file_identity(file_path)
+        if identity is None:
+            return False
+        with self._lock:
+            return ((kind,) + identity) in self._entries
+
+    def get_or_load(self, kind, file_path, loader, sizer=None, on_evict=None):
+        """命中时直接返回缓存对象，否则调用loader加载并放入缓存
+
+        sizer 用于估算对象占用的字节数，默认使用文件大小；
+        on_evict 用于关闭并发加载时被丢弃的重复对象，它尚未交给任何使用者。
+        """
+        identity = file_identity(file_path)
+        if identity is None:
+            raise FileNotFoundError(file_path)
+        key = (kind,) + identity
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+
+        value = loader(file_path)
+        size = sizer(value) if sizer else identity[2]
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # 其他线程已经加载完成，丢弃本次结果
+                if on_evict:
+                    on_evict(value)
+                self._entries.move_to_end(key)
+                return existing.value
+            # 同一文件旧版本的条目已经过期
+            self._drop(file_path, lambda k: k[1:] != identity)
+            # 超出整个预算的对象不放入缓存
+            if size <= self.max_bytes:
+                self._entries[key] = _Entry(value, size)
+                self._keys_by_path.setdefault(file_path, set()).add(key)
+                self.current_bytes += size
+                self._evict_over_budget()
+        return value
+
+    def invalidate(self, file_path):
+        """删除某个文件相关的全部缓存条目"""
+        with self._lock:
+            return self._drop(file_path, lambda k: True)
+
+    def clear(self):
+        with self._lock:
+            return sum(self._drop(path, lambda k: True) for path in list(self._keys_by_path))
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / total) if total else 0.0,
+            }
+
+    def _drop(self, file_path, predicate):
+        keys = self._keys_by_path.get(file_path)
+        if not keys:
+            return 0
+        removed = [k for k in keys if predicate(k)]
+        for key in removed:
+            self._forget(key)
+            self._release(self._entries.pop(key))
+        return len(removed)
+
+    def _forget(self, key):
+        keys = self._keys_by_path.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_path[key[1]]
+
+    def _evict_over_budget(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._forget(key)
+            self._release(entry)
+            self.evictions += 1
+
+    def _release(self, entry):
+        self.current_bytes -= entry.size
+
+
+# 进程级共享实例
+cache = BookCache(int(os.getenv('BOOK_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
@@ -1,180 +1,541 @@
 import os
-import ebooklib
-from ebooklib import epub
-import os
+import sys
+import json
+import bisect
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from epub_reader import EpubReader
 from PyPDF2 import PdfFileReader
 import re
 from bs4 import BeautifulSoup
+from book_cache import cache as book_cache, file_identity
+from shared_cache import shared_cache
+from txt_index import TxtIndex, remove_index
+from chunk_store import ChunkStore, build_store, remove_store
+import pdf_extract
+
+# TXT每页显示的行数
+TXT_LINES_PER_PAGE = 50
+
+# 每页最多字符数，超长的EPUB章节在段落边界拆分为多页
+PAGE_MAX_CHARS = 10000
+
+# TXT按字节分页，UTF-8中文每字3字节
+TXT_PAGE_MAX_BYTES = PAGE_MAX_CHARS * 3
+
+# EPUB按文档解压后的字节数分页，不需要解析全书即可得到分页表
+EPUB_PAGE_MAX_BYTES = PAGE_MAX_CHARS * 3
+
+# 分页方案版本，记录在 Book.page_scheme 中；旧数据（NULL）的position为整章或固定行数，
+# 方案2的EPUB按正文字符数拆分文档
+PAGE_SCHEME = 3
+
+# 页面内容格式版本，分页或提取规则变化时递增，使客户端缓存失效
+CONTENT_VERSION = 3
+
+# 目录辅助文件后缀
+TOC_SUFFIX = '.toc.json'
+
+# 预读相邻页面的后台线程
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+# 分块存储在缓存中的估算占用（SQLite连接的页缓存）
+_STORE_ENTRY_BYTES = 256 * 1024
 
 def get_supported_formats():
     """返回支持的电子书格式列表"""
     return ['.epub', '.pdf', '.txt']
 
+def invalidate_book(file_path):
+    """清除某本书在进程内缓存中的全部解析结果"""
+    return book_cache.invalidate(file_path)
+
+def get_cache_stats():
+    """返回书籍缓存的统计信息"""
+    return book_cache.stats()
+
+def _open_epub(file_path):
+    """从缓存获取EPUB读取器，只包含清单信息，内容按需解压"""
+    return book_cache.get_or_load('epub', file_path, EpubReader,
+                                  sizer=lambda reader: reader.nbytes(),
+                                  on_evict=lambda reader: reader.close())
+
+class _PdfHandle:
+    """保持打开的PDF文件句柄及其解析器，读取时需持有锁"""
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'rb')
+        try:
+            self.reader = PdfFileReader(self.file)
+        except Exception:
+            self.file.close()
+            raise
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.file.close()
+
+def _open_pdf(file_path):
+    """从缓存获取已打开的PDF解析器"""
+    return book_cache.get_or_load('pdf', file_path, _PdfHandle,
+                                  on_evict=lambda handle: handle.close())
+
+def _open_txt(file_path):
+    """从缓存获取TXT分页索引"""
+    return book_cache.get_or_load('txt', file_path,
+                                  lambda path: TxtIndex(path, TXT_LINES_PER_PAGE, TXT_PAGE_MAX_BYTES),
+                                  sizer=lambda index: index.nbytes(),
+                                  on_evict=lambda index: index.close())
+
+def split_text(text, max_chars=PAGE_MAX_CHARS):
+    """按段落边界把文本切分为不超过 max_chars 的片段，返回 [(start, end)]
+
+    单个段落超过上限时直接按长度拆开。空文本也返回一个空片段，保证每章至少一页。
+    """
+    ranges = []
+    start = pos = 0
+    length = len(text)
+    while pos < length:
+        newline = text.find('\n', pos)
+        paragraph_end = length if newline < 0 else newline + 1
+        if paragraph_end - start <= max_chars:
+            pos = paragraph_end
+        elif pos > start:
+            ranges.append((start, pos))
+            start = pos
+        else:
+            ranges.append((start, start + max_chars))
+            start = pos = start + max_chars
+    if start < length or not ranges:
+        ranges.append((start, length))
+    return ranges
+
+def split_even(text, parts):
+    """把文本切分为恰好 parts 个片段，返回 [(start, end)]
+
+    分界取等分点之后最近的段落边界，四分之一段以内没有换行时直接在等分点拆开。
+    """
+    length = len(text)
+    window = length // parts // 4
+    bounds = [0]
+    for i in range(1, parts):
+        target = max(length * i // parts, bounds[-1])
+        newline = text.find('\n', target, target + window)
+        bounds.append(newline + 1 if newline >= 0 else target)
+    bounds.append(length)
+    return list(zip(bounds, bounds[1:]))
+
+def _open_store(file_path):
+    """获取书籍的分块存储，尚未生成或已过期时返回None"""
+    try:
+        return book_cache.get_or_load('chunks', file_path, ChunkStore,
+                                      sizer=lambda store: _STORE_ENTRY_BYTES,
+                                      on_evict=lambda store: store.close())
+    except (OSError, ValueError, KeyError, sqlite3.Error):
+        return None
+
+def _iter_pdf_pages(file_path):
+    """PDF页面在进程池中并行提取"""
+    texts = pdf_extract.extract_pages(file_path)
+    for position, text in enumerate(texts):
+        yield {
+            "content": text,
+            "position": position,
+            "total_positions": len(texts),
+            "title": f"Page {position + 1}"
+        }
+
+def _iter_pages(file_path, file_format):
+    """按position顺序逐页解析书籍内容"""
+    if file_format == '.pdf':
+        yield from _iter_pdf_pages(file_path)
+        return
+    reader = {
+        '.epub': get_epub_content,
+        '.pdf': get_pdf_content,
+        '.txt': get_txt_content,
+    }[file_format]
+    first = reader(file_path, 0)
+    if first['total_positions'] == 0:
+        return
+    yield first
+    for position in range(1, first['total_positions']):
+        yield reader(file_path, position)
+
+def build_book_store(file_path, file_format, force=False):
+    """将书籍全部页面预先解析写入分块存储，返回总页数
+
+    存储已存在且与文件一致时直接复用（相同内容的书籍只处理一次），force 强制重建。
+    """
+    file_format = file_format.lower()
+    if file_format not in get_supported_formats():
+        raise ValueError("不支持的文件格式")
+    if not force:
+        store = _open_store(file_path)
+        if store is not None:
+            _load_toc_data(file_path, file_format)
+            return store.total_positions
+    total = build_store(file_path, _iter_pages(file_path, file_format),
+                        meta={'format': file_format})
+    # 同时生成目录辅助文件
+    _load_toc_data(file_path, file_format)
+    # 之后的读取直接走分块存储，释放解析过程中缓存的对象
+    book_cache.invalidate(file_path)
+    return total
+
+def iter_store_pages(file_path):
+    """遍历分块存储中的全部页面，产生 (position, title, content)"""
+    store = ChunkStore(file_path)
+    try:
+        yield from store.iter_pages()
+    finally:
+        store.close()
+
+def get_legacy_positions(file_path, file_format, scheme=None):
+    """返回分页方案 scheme 下的position到当前position的映射列表，分页没有变化时返回None"""
+    file_format = file_format.lower()
+    if file_format == '.epub':
+        if scheme is None:
+            return _epub_page_map(file_path)['legacy']
+        if scheme == 2:
+            return _split_scheme_positions(file_path)
+        return None
+    if file_format == '.txt' and scheme is None:
+        return list(_open_txt(file_path).legacy)
+    return None
+
+def remove_book_artifacts(file_path):
+    """删除书籍的缓存和辅助文件"""
+    invalidate_book(file_path)
+    shared_cache.invalidate(file_path)
+    remove_index(file_path)
+    remove_store(file_path)
+    try:
+        os.remove(_toc_path(file_path))
+    except OSError:
+        pass
+
+def _load_page(file_path, file_format, position):
+    """读取一页内容：优先使用分块存储，否则解析原文件"""
+    # 已预处理的书籍直接从分块存储读取
+    store = _open_store(file_path)
+    if store is not None:
+        page = store.get_page(position)
+        if page is not None:
+            return page
+    
+    # 未预处理的书籍解析原文件，结果写入多进程共享的缓存
+    key = _shared_page_key(file_path, position)
+    if key is not None:
+        page = shared_cache.get(key)
+        if page is not None:
+            return page
+    page = _parse_page(file_path, file_format, position)
+    # PDF提取超时的占位页不写入共享缓存，之后可以重试
+    if key is not None and page.get('content') != pdf_extract.PLACEHOLDER.format(page=position + 1):
+        shared_cache.put(key, file_path, page)
+    return page
+
+def _parse_page(file_path, file_format, position):
+    """解析原文件读取一页内容"""
+    if file_format == '.epub':
+        return get_epub_content(file_path, position)
+    elif file_format == '.pdf':
+        return get_pdf_content(file_path, position)
+    else:
+        return get_txt_content(file_path, position)
+
+def _shared_page_key(file_path, position):
+    """共享缓存的键：内容版本、文件身份和position"""
+    identity = file_identity(file_path)
+    if identity is None:
+        return None
+    path, mtime_ns, size = identity
+    return f'page:{CONTENT_VERSION}:{mtime_ns}:{size}:{position}:{path}'
+
+def _page_size(page):
+    return sys.getsizeof(page.get('content') or '') + 256
+
 def get_book_content(file_path, file_format, position=0):
     """根据文件格式获取书籍内容"""
     if not os.path.exists(file_path):
         return {"error": "文件不存在"}
     
     file_format = file_format.lower()
+    if file_format not in get_supported_formats():
+        return {"error": "不支持的文件格式"}
     
     try:
-        if file_format == '.epub':
-            return get_epub_content(file_path, position)
-        elif file_format == '.pdf':
-            return get_pdf_content(file_path, position)
-        elif file_format == '.txt':
-            return get_txt_content(file_path, position)
-        else:
-            return {"error": "不支持的文件格式"}
+        return book_cache.get_or_load(
+            ('page', position), file_path,
+            lambda path: _load_page(path, file_format, position),
+            sizer=_page_size)
     except Exception as e:
         return {"error": f"读取文件出错: {str(e)}"}
 
+def get_book_pages(file_path, file_format, start, count):
+    """读取从start开始的连续多页，超出总页数的部分不返回"""
+    if not os.path.exists(file_path):
+        return {"error": "文件不存在"}
+    
+    file_format = file_format.lower()
+    if file_format not in get_supported_formats():
+        return {"error": "不支持的文件格式"}
+    
+    try:
+        store = _open_store(file_path)
+        if store is not None:
+            return {
+                "pages": store.get_range(start, count),
+                "total_positions": store.total_positions
+            }
+        
+        pages = []
+        total = None
+        for position in range(start, start + count):
+            if total is not None and position >= total:
+                break
+            page = get_book_content(file_path, file_format, position)
+            if 'error' in page:
+                return page
+            total = page['total_positions']
+            # 越界时单页读取会回到第一页，这里直接结束
+            if page['position'] != position:
+                break
+            pages.append(page)
+        if total is None:
+            total = get_book_content(file_path, file_format, 0).get('total_positions', 0)
+        return {"pages": pages, "total_positions": total}
+    except Exception as e:
+        return {"error": f"读取文件出错: {str(e)}"}
+
+def prefetch_pages(file_path, file_format, positions):
+    """在后台线程中预读指定页面，放入缓存"""
+    for position in positions:
+        if position < 0:
+            continue
+        key = (file_path, position)
+        if book_cache.contains(('page', position), file_path):
+            continue
+        with _prefetch_lock:
+            if key in _prefetching:
+                continue
+            _prefetching.add(key)
+        _prefetch_executor.submit(_prefetch_one, file_path, file_format, position)
+
+def _prefetch_one(file_path, file_format, position):
+    try:
+        get_book_content(file_path, file_format, position)
+    finally:
+        with _prefetch_lock:
+            _prefetching.discard((file_path, position))
+
+def _toc_path(file_path):
+    return file_path + TOC_SUFFIX
+
+def _build_toc_data(file_path, file_format):
+    """解析书籍目录并生成目录 -> position 映射"""
+    if file_format == '.epub':
+        toc = get_epub_toc(file_path)
+        toc_positions = _get_epub_toc_positions(file_path, toc)
+    elif file_format == '.pdf':
+        toc = get_pdf_toc(file_path)
+        toc_positions = []
+        for item in toc:
+            # PDF页码通常从1开始，这里转为0基索引
+            page = int(item.get('page', 1))
+            position = max(0, page - 1)
+            toc_positions.append({
+                'title': item.get('title', f'Page {page}') ,
+                'position': position
+            })
+    else:
+        # TXT文件没有目录结构
+        toc, toc_positions = [], []
+    return {'toc': toc, 'toc_positions': toc_positions}
+
+def _load_toc_data(file_path, file_format):
+    """读取目录辅助文件，缺失或过期时重新生成并写入"""
+    st = os.stat(file_path)
+    identity = [st.st_mtime_ns, st.st_size]
+    try:
+        with open(_toc_path(file_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') == identity and data.get('version') == CONTENT_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+
+    data = _build_toc_data(file_path, file_format)
+    data['source'] = identity
+    data['version'] = CONTENT_VERSION
+    tmp_path = f'{_toc_path(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, _toc_path(file_path))
+    except OSError as e:
+        print(f"写入目录文件出错: {str(e)}")
+    return data
+
+def is_toc_current(file_path):
+    """目录辅助文件是否存在且与书籍文件和当前版本一致"""
+    st = os.stat(file_path)
+    try:
+        with open(_toc_path(file_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return data.get('source') == [st.st_mtime_ns, st.st_size] and data.get('version') == CONTENT_VERSION
+
+def build_book_toc(file_path, file_format, force=False):
+    """生成目录辅助文件，已是最新时直接复用，force 强制重新解析"""
+    if force:
+        try:
+            os.remove(_toc_path(file_path))
+        except OSError:
+            pass
+    _load_toc_data(file_path, file_format.lower())
+
+def _get_toc_data(file_path, file_format):
+    """从缓存获取目录数据，每个文件只解析一次"""
+    file_format = file_format.lower()
+    return book_cache.get_or_load(
+        'toc', file_path, lambda path: _load_toc_data(path, file_format),
+        sizer=lambda data: sys.getsizeof(json.dumps(data, ensure_ascii=False, default=str)))
+
 def get_book_toc(file_path, file_format):
     """获取书籍目录"""
     if not os.path.exists(file_path):
         return []
     
-    file_format = file_format.lower()
-    
     try:
-        if file_format == '.epub':
-            return get_epub_toc(file_path)
-        elif file_format == '.pdf':
-            return get_pdf_toc(file_path)
-        elif file_format == '.txt':
-            return []  # TXT文件没有目录结构
-        else:
-            return []
+        return _get_toc_data(file_path, file_format)['toc']
     except Exception as e:
         print(f"获取目录出错: {str(e)}")
         return []
 
 def get_book_toc_positions(file_path, file_format):
     """将目录项映射到内容位置（position），用于侧边栏跳转"""
-    file_format = file_format.lower()
     try:
-        if file_format == '.epub':
-            return _get_epub_toc_positions(file_path)
-        elif file_format == '.pdf':
-            toc = get_pdf_toc(file_path)
-            positions = []
-            for item in toc:
-                # PDF页码通常从1开始，这里转为0基索引
-                page = int(item.get('page', 1))
-                position = max(0, page - 1)
-                positions.append({
-                    'title': item.get('title', f'Page {page}') ,
-                    'position': position
-                })
-            return positions
-        elif file_format == '.txt':
-            # TXT没有目录，返回空列表
-            return []
-        else:
-            return []
+        return _get_toc_data(file_path, file_format)['toc_positions']
     except Exception as e:
         print(f"生成目录位置映射出错: {str(e)}")
         return []
 
-def get_epub_content(file_path, position=0):
-    """获取EPUB格式电子书内容"""
-    book = epub.read_epub(file_path)
-    
-    # 获取所有文档
-    documents = []
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            documents.append(item)
-    
-    # 按照position获取当前文档
-    if position >= len(documents):
-        position = 0
-    
-    current_doc = documents[position]
-    content = current_doc.get_content().decode('utf-8')
+def _extract_epub_text(reader, index):
+    """解压并提取一个文档的正文，返回 (文件名, 文本)"""
+    name, content = reader.read_document(index)
     
     # 使用BeautifulSoup解析HTML
-    soup = BeautifulSoup(content, 'html.parser')
+    soup = BeautifulSoup(content.decode('utf-8'), 'html.parser')
     
-    # 提取文本内容
-    text_content = soup.get_text()
+    # 只提取body，<head>中的标题等不属于正文
+    text_content = (soup.body or soup).get_text()
     
     # 清理文本
-    text_content = re.sub(r'\n+', '\n', text_content)
+    return name, re.sub(r'\n+', '\n', text_content)
+
+def _epub_doc_text(file_path, index):
+    """从缓存获取一个文档的正文"""
+    return book_cache.get_or_load(
+        ('text', index), file_path,
+        lambda path: _extract_epub_text(_open_epub(path), index),
+        sizer=lambda item: sys.getsizeof(item[1]))
+
+def _build_epub_page_map(file_path):
+    """计算每一页对应的 (文档序号, 文档内页序号, 文档页数)，以及每个文档的首页
+
+    页数由文档解压后的大小决定，只读取压缩包目录，不解压文档；
+    读取某一页时才把所在文档的正文切分为相应的页数。
+    """
+    reader = _open_epub(file_path)
+    pages, first_pages = [], []
+    for index in range(reader.total_positions):
+        first_pages.append(len(pages))
+        count = max(1, -(-reader.document_size(index) // EPUB_PAGE_MAX_BYTES))
+        pages.extend((index, part, count) for part in range(count))
+    return {'pages': pages, 'legacy': first_pages}
+
+def _epub_page_map(file_path):
+    """从缓存获取EPUB分页表，每个文件只计算一次"""
+    return book_cache.get_or_load(
+        'pagemap', file_path, _build_epub_page_map,
+        sizer=lambda page_map: 96 * len(page_map['pages']) + 32 * len(page_map['legacy']))
+
+def _split_scheme_positions(file_path):
+    """分页方案2（按正文字符数拆分文档）的position到当前position的映射
+
+    需要解析全部文档，只在转换已保存的进度和书签时使用一次；按每页起始字符所在的新页对应。
+    """
+    page_map = _epub_page_map(file_path)
+    first_pages = page_map['legacy'] + [len(page_map['pages'])]
+    mapping = []
+    for index in range(len(page_map['legacy'])):
+        _, text = _epub_doc_text(file_path, index)
+        first = first_pages[index]
+        starts = [start for start, _ in split_even(text, first_pages[index + 1] - first)]
+        mapping.extend(first + bisect.bisect_right(starts, start) - 1
+                       for start, _ in split_text(text))
+    return mapping
+
+def get_epub_content(file_path, position=0):
+    """获取EPUB格式电子书内容"""
+    pages = _epub_page_map(file_path)['pages']
+    
+    # 按照position获取当前页，只解压所在的文档
+    if position >= len(pages):
+        position = 0
+    
+    index, part, count = pages[position]
+    name, text_content = _epub_doc_text(file_path, index)
+    start, end = split_even(text_content, count)[part]
     
     return {
-        "content": text_content,
+        "content": text_content[start:end],
         "position": position,
-        "total_positions": len(documents),
-        "title": current_doc.get_name()
+        "total_positions": len(pages),
+        "title": name
     }
 
 def get_epub_toc(file_path):
     """获取EPUB格式电子书目录"""
-    book = epub.read_epub(file_path)
-    toc = []
-    
-    # 获取目录
-    for item in book.toc:
-        try:
-            if isinstance(item, tuple) and len(item) == 2:
-                section, children = item
-                if hasattr(section, 'title') and hasattr(section, 'href'):
-                    toc_item = {
-                        "title": section.title,
-                        "href": section.href,
-                        "children": []
-                    }
-                    
-                    # 处理子目录
-                    for child in children:
-                        if hasattr(child, 'title') and hasattr(child, 'href'):
-                            toc_item["children"].append({
-                                "title": child.title,
-                                "href": child.href
-                            })
-                    
-                    toc.append(toc_item)
-            elif hasattr(item, 'title') and hasattr(item, 'href'):
-                toc.append({
-                    "title": item.title,
-                    "href": item.href
-                })
-        except Exception as e:
-            print(f"处理目录项时出错: {str(e)}")
-            continue
-    
-    return toc
+    try:
+        return _open_epub(file_path).toc()
+    except Exception as e:
+        print(f"解析目录时出错: {str(e)}")
+        return []
 
-def _get_epub_toc_positions(file_path):
+def _get_epub_toc_positions(file_path, raw_toc=None):
     """为EPUB生成平铺的目录 -> position 映射"""
-    book = epub.read_epub(file_path)
-    # 构建文档文件名列表（按阅读顺序）
-    doc_items = []
-    for item in book.get_items():
-        try:
-            if item.get_type() == epub.ITEM_DOCUMENT:
-                # 尝试获取更稳定的文件名/路径
-                name = getattr(item, 'file_name', None)
-                if not name:
-                    # 有些版本使用get_name作为文件名
-                    name = item.get_name()
-                doc_items.append(str(name))
-        except Exception:
-            continue
+    # 文档文件名列表（按阅读顺序），以及每个文档的首页
+    doc_items = [name for _, name in _open_epub(file_path).documents]
+    first_pages = _epub_page_map(file_path)['legacy']
+
+    # 文件名 -> position 索引，同名时保留阅读顺序中的第一个
+    index_by_base = {}
+    for idx, dn in enumerate(doc_items):
+        index_by_base.setdefault(os.path.basename(dn), idx)
 
     # 获取原始目录
-    raw_toc = get_epub_toc(file_path)
+    if raw_toc is None:
+        raw_toc = get_epub_toc(file_path)
 
     def match_position_by_href(href: str) -> int:
-        # 仅取文件名进行匹配
-        base = os.path.basename(href or '')
+        # 仅取文件名进行匹配，忽略锚点
+        base = os.path.basename((href or '').split('#', 1)[0])
         if not base:
             return 0
-        # 直接匹配或后缀匹配
+        # 直接匹配
+        if base in index_by_base:
+            return index_by_base[base]
+        # 后缀匹配
         for idx, dn in enumerate(doc_items):
             dn_base = os.path.basename(dn)
-            if dn_base == base or dn.endswith(base) or base in dn_base:
+            if dn.endswith(base) or base in dn_base:
                 return idx
         # 未匹配时回退到0
         return 0
@@ -185,14 +546,14 @@ def _get_epub_toc_positions(file_path):
             if 'href' in item and 'title' in item:
                 positions.append({
                     'title': item['title'],
-                    'position': match_position_by_href(item['href'])
+                    'position': first_pages[match_position_by_href(item['href'])]
                 })
             # 展平子目录
             for child in item.get('children', []) or []:
                 if 'href' in child and 'title' in child:
                     positions.append({
                         'title': child['title'],
-                        'position': match_position_by_href(child['href'])
+                        'position': first_pages[match_position_by_href(child['href'])]
                     })
         except Exception:
             continue
@@ -200,61 +561,60 @@ def _get_epub_toc_positions(file_path):
 
 def get_pdf_content(file_path, position=0):
     """获取PDF格式电子书内容"""
-    with open(file_path, 'rb') as f:
-        pdf = PdfFileReader(f)
-        num_pages = pdf.getNumPages()
-        
-        if position >= num_pages:
-            position = 0
-        
-        page = pdf.getPage(position)
-        text = page.extractText()
-        
-        return {
-            "content": text,
-            "position": position,
-            "total_positions": num_pages,
-            "title": f"Page {position + 1}"
-        }
+    handle = _open_pdf(file_path)
+    with handle.lock:
+        num_pages = handle.reader.getNumPages()
+    
+    if position >= num_pages:
+        position = 0
+    
+    # 文本提取在进程池中进行，超时返回占位文字
+    text = pdf_extract.extract_page(file_path, position)
+    
+    return {
+        "content": text,
+        "position": position,
+        "total_positions": num_pages,
+        "title": f"Page {position + 1}"
+    }
 
 def get_pdf_toc(file_path):
     """获取PDF格式电子书目录"""
-    with open(file_path, 'rb') as f:
-        pdf = PdfFileReader(f)
+    handle = _open_pdf(file_path)
+    with handle.lock:
+        pdf = handle.reader
         toc = []
         
         # 尝试获取PDF的目录
         if pdf.getOutlines():
             for outline in pdf.getOutlines():
                 if isinstance(outline, dict) and '/Title' in outline:
+                    # 将目标页对象转换为从1开始的页码
+                    try:
+                        page = pdf.getDestinationPageNumber(outline) + 1
+                    except Exception:
+                        page = 0
                     toc.append({
-                        "title": outline['/Title'],
-                        "page": outline['/Page'] if '/Page' in outline else 0
+                        "title": str(outline['/Title']),
+                        "page": page
                     })
         
         return toc
 
 def get_txt_content(file_path, position=0):
     """获取TXT格式电子书内容"""
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        # 每页显示的行数
-        lines_per_page = 50
-        
-        # 读取所有行
-        all_lines = f.readlines()
-        total_pages = (len(all_lines) + lines_per_page - 1) // lines_per_page
-        
-        if position >= total_pages:
-            position = 0
-        
-        # 获取当前页的内容
-        start_line = position * lines_per_page
-        end_line = min(start_line + lines_per_page, len(all_lines))
-        content = ''.join(all_lines[start_line:end_line])
-        
-        return {
-            "content": content,
-            "position": position,
-            "total_positions": total_pages,
-            "title": f"Page {position + 1}"
-        }
\ No newline at end of file
+    index = _open_txt(file_path)
+    total_pages = index.page_count
+    
+    if position >= total_pages:
+        position = 0
+    
+    # 只读取当前页的字节
+    content = index.page(position)
+    
+    return {
+        "content": content,
+        "position": position,
+        "total_positions": total_pages,
+        "title": f"Page {position + 1}"
+    }
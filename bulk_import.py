@@ -0,0 +1,292 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from PyPDF2 import PdfFileReader
+from book_handlers import get_supported_formats, PAGE_SCHEME
+from epub_reader import EpubReader
+from ingest import ingest_book
+from covers import covers
+from models import db, Book
+from storage import stage_upload, store_staged, remove_staged, object_lock
+
+# 批量导入的压缩包扩展名
+ARCHIVE_EXT = '.zip'
+
+# 判断文件格式时读取的字节数
+SNIFF_BYTES = 8192
+
+# 导入条目的状态
+ITEM_QUEUED = 'queued'
+ITEM_PROCESSING = 'processing'
+ITEM_READY = 'ready'
+ITEM_FAILED = 'failed'
+ITEM_SKIPPED = 'skipped'
+
+FINAL_STATUSES = (ITEM_READY, ITEM_FAILED, ITEM_SKIPPED)
+
+
+def detect_format(file_path):
+    """根据文件内容判断格式，返回扩展名，无法识别时返回None"""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    if head.startswith(b'%PDF-'):
+        return '.pdf'
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(file_path) as zf:
+                names = set(zf.namelist())
+                if 'META-INF/container.xml' in names or \
+                        ('mimetype' in names and zf.read('mimetype').strip() == b'application/epub+zip'):
+                    return '.epub'
+        except zipfile.BadZipFile:
+            pass
+        return None
+    # 文本文件中不会出现NUL字节
+    if b'\x00' not in head:
+        return '.txt'
+    return None
+
+
+def extract_title(file_path, file_format):
+    """读取书籍元数据中的书名，没有时返回None"""
+    try:
+        if file_format == '.epub':
+            reader = EpubReader(file_path)
+            try:
+                return reader.title
+            finally:
+                reader.close()
+        if file_format == '.pdf':
+            with open(file_path, 'rb') as f:
+                info = PdfFileReader(f, strict=False).getDocumentInfo()
+                title = str(info.title).strip() if info and info.title else ''
+            return title or None
+    except Exception:
+        return None
+    return None
+
+
+class ImportJob:
+    """一次批量导入：每个文件一条记录，状态在处理过程中更新"""
+
+    def __init__(self, user_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.created_at = datetime.utcnow()
+        self.items = []
+        self.futures = []
+        self._lock = threading.Lock()
+
+    def add_item(self, name, status=ITEM_QUEUED, error=None):
+        item = {'name': name, 'status': status, 'book_id': None, 'error': error}
+        with self._lock:
+            self.items.append(item)
+        return item
+
+    def update(self, item, **values):
+        with self._lock:
+            item.update(values)
+
+    def wait(self, timeout=None):
+        """等待全部条目处理完成；解压过程中新加入的条目也会等待"""
+        while True:
+            with self._lock:
+                pending = [f for f in self.futures if not f.done()]
+            if not pending:
+                return True
+            _, not_done = wait(pending, timeout=timeout)
+            if not_done:
+                return False
+
+    def to_dict(self):
+        with self._lock:
+            items = [dict(item) for item in self.items]
+            running = any(not f.done() for f in self.futures)
+        counts = {}
+        for item in items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return {
+            'id': self.id,
+            'created_at': self.created_at.isoformat(),
+            'done': not running,
+            'total': len(items),
+            'counts': counts,
+            'items': items,
+        }
+
+
+class BulkImporter:
+    """批量导入多个书籍文件或zip压缩包
+
+    文件在请求中分块写入内容寻址存储；格式检测、书名提取、建立书籍记录和预处理
+    在固定大小的线程池中并发执行。压缩包先保存为临时文件，由后台逐个解压条目。
+    导入进度保存在本进程内存中，只保留最近的 history 个任务。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.folder = None
+        self.history = 50
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config['UPLOAD_FOLDER']
+        self.history = app.config.get('IMPORT_JOB_HISTORY', self.history)
+        self._executor = ThreadPoolExecutor(max_workers=app.config.get('IMPORT_WORKERS', 4),
+                                            thread_name_prefix='import')
+
+    def start(self, user_id):
+        """创建导入任务"""
+        job = ImportJob(user_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def add(self, job, name, stream):
+        """加入一个上传的文件；zip压缩包保存为临时文件后在后台展开"""
+        ext = os.path.splitext(name)[1].lower()
+        if ext == ARCHIVE_EXT:
+            tmp_dir = os.path.join(self.folder, 'imports')
+            os.makedirs(tmp_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=ARCHIVE_EXT)
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            self._submit(job, self._expand_archive, job, name, tmp_path, True)
+        else:
+            self._store(job, name, stream)
+
+    def add_path(self, job, path):
+        """加入本地文件、目录或zip压缩包，供命令行导入使用"""
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    if not filename.startswith('.'):
+                        self.add_path(job, os.path.join(root, filename))
+        elif path.lower().endswith(ARCHIVE_EXT):
+            self._submit(job, self._expand_archive, job, path, path, False)
+        else:
+            with open(path, 'rb') as f:
+                self._store(job, path, f)
+
+    def _submit(self, job, fn, *args):
+        future = self._executor.submit(fn, *args)
+        with job._lock:
+            job.futures.append(future)
+
+    def _store(self, job, name, stream, size=None):
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in get_supported_formats():
+            job.add_item(name, ITEM_SKIPPED, '不支持的文件格式')
+            return
+        max_size = self.app.config.get('MAX_CONTENT_LENGTH')
+        if size is not None and max_size and size > max_size:
+            job.add_item(name, ITEM_SKIPPED, '文件过大')
+            return
+        item = job.add_item(name)
+        try:
+            tmp_path, digest = stage_upload(stream, self.folder)
+        except Exception as e:
+            job.update(item, status=ITEM_FAILED, error=f'保存文件出错: {str(e)}')
+            return
+        self._submit(job, self._process, job, item, tmp_path, digest, ext)
+
+    def _expand_archive(self, job, name, archive_path, remove):
+        """逐个解压压缩包中的条目并加入导入队列"""
+        try:
+            with zipfile.ZipFile(archive_path) as zf:
+                for info in zf.infolist():
+                    entry = info.filename
+                    basename = os.path.basename(entry)
+                    if info.is_dir() or not basename or basename.startswith('.') \
+                            or entry.startswith('__MACOSX/'):
+                        continue
+                    with zf.open(info) as f:
+                        self._store(job, f'{name}/{entry}', f, size=info.file_size)
+        except zipfile.BadZipFile:
+            job.add_item(name, ITEM_FAILED, '无效的zip压缩包')
+        finally:
+            if remove:
+                os.remove(archive_path)
+
+    def _process(self, job, item, tmp_path, digest, ext):
+        """检测格式、提取书名，再放入存储、建立书籍记录并预处理"""
+        job.update(item, status=ITEM_PROCESSING)
+        try:
+            # 先检查暂存文件，被拒绝的内容不进入共享的内容寻址存储
+            detected = detect_format(tmp_path)
+            if detected != ext:
+                job.update(item, status=ITEM_FAILED, error='文件内容与扩展名不符')
+                return
+            stem = os.path.splitext(os.path.basename(item['name']))[0]
+            title = (extract_title(tmp_path, ext) or stem)[:200]
+
+            with self.app.app_context():
+                try:
+                    # 放入存储和添加书籍记录在同一把锁内完成，不会与删除相同内容的书籍交错
+                    with object_lock(self.folder):
+                        path = store_staged(tmp_path, self.folder, digest, ext)
+                        book = Book(title=title, file_path=path, file_format=ext, user_id=job.user_id,
+                                    content_hash=digest, status=Book.STATUS_PROCESSING,
+                                    page_scheme=PAGE_SCHEME)
+                        # 相同内容已处理完成时直接复用结果
+                        existing = Book.query.filter_by(file_path=path, status=Book.STATUS_READY,
+                                                        page_scheme=PAGE_SCHEME).first()
+                        if existing is not None:
+                            book.status = Book.STATUS_READY
+                            book.total_positions = existing.total_positions
+                        db.session.add(book)
+                        try:
+                            db.session.commit()
+                        except Exception:
+                            # 记录未能写入时，删除没有其他书籍引用的文件
+                            db.session.rollback()
+                            if not Book.query.filter_by(file_path=path).count() and os.path.exists(path):
+                                os.remove(path)
+                            raise
+                    book_id, status = book.id, book.status
+                finally:
+                    db.session.remove()
+            job.update(item, book_id=book_id)
+
+            # 在导入线程中直接预处理，限制同时处理的书籍数
+            if status == Book.STATUS_PROCESSING:
+                ingest_book(self.app, book_id)
+                with self.app.app_context():
+                    try:
+                        status = db.session.query(Book.status).filter_by(id=book_id).scalar()
+                    finally:
+                        db.session.remove()
+            else:
+                covers.submit(book_id)
+
+            if status == Book.STATUS_READY:
+                job.update(item, status=ITEM_READY)
+            else:
+                job.update(item, status=ITEM_FAILED, error='预处理失败')
+        except Exception as e:
+            self.app.logger.error(f"导入 {item['name']} 出错: {str(e)}")
+            job.update(item, status=ITEM_FAILED, error=str(e))
+        finally:
+            # 放入存储后暂存文件已不存在，其余情况在这里清理
+            remove_staged(tmp_path)
+
+
+bulk_importer = BulkImporter()
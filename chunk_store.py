@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import threading
+
+# 分块存储文件后缀，与书籍文件放在同一目录
+STORE_SUFFIX = '.chunks'
+
+# 存储格式版本，格式变化时递增以触发重建
+STORE_VERSION = 3
+
+
+def store_path(file_path):
+    return file_path + STORE_SUFFIX
+
+
+def build_store(file_path, pages, meta=None):
+    """将逐页内容写入分块存储，返回总页数
+
+    pages 为按position顺序产生 {"title", "content"} 的可迭代对象。
+    先写入临时文件再原子替换，读取方不会看到写了一半的存储。
+    """
+    st = os.stat(file_path)
+    tmp_path = f'{store_path(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE pages (position INTEGER PRIMARY KEY, title TEXT, content TEXT)')
+        total = 0
+        for position, page in enumerate(pages):
+            conn.execute('INSERT INTO pages VALUES (?, ?, ?)',
+                         (position, page.get('title'), page.get('content', '')))
+            total = position + 1
+        values = dict(meta or {})
+        values.update({
+            'version': STORE_VERSION,
+            'source_mtime_ns': st.st_mtime_ns,
+            'source_size': st.st_size,
+            'total_positions': total,
+        })
+        conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                         [(k, str(v)) for k, v in values.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, store_path(file_path))
+    return total
+
+
+def remove_store(file_path):
+    try:
+        os.remove(store_path(file_path))
+    except OSError:
+        pass
+
+
+class ChunkStore:
+    """只读的分块存储，按position单次索引查询页面内容"""
+
+    def __init__(self, file_path):
+        path = store_path(file_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self._conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        try:
+            self.meta = dict(self._conn.execute('SELECT key, value FROM meta'))
+            st = os.stat(file_path)
+            if (int(self.meta.get('version', 0)) != STORE_VERSION
+                    or int(self.meta['source_mtime_ns']) != st.st_mtime_ns
+                    or int(self.meta['source_size']) != st.st_size):
+                raise ValueError('分块存储已过期')
+        except Exception:
+            self._conn.close()
+            raise
+        self.total_positions = int(self.meta['total_positions'])
+
+    def get_page(self, position):
+        """读取一页内容，越界时回到第一页"""
+        if position >= self.total_positions:
+            position = 0
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT title, content FROM pages WHERE position = ?', (position,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "content": row[1],
+            "position": position,
+            "total_positions": self.total_positions,
+            "title": row[0]
+        }
+
+    def get_range(self, start, count):
+        """一次查询读取从start开始的连续count页，不做越界回绕"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT position, title, content FROM pages '
+                'WHERE position >= ? AND position < ? ORDER BY position',
+                (start, start + count)
+            ).fetchall()
+        return [{
+            "content": content,
+            "position": position,
+            "total_positions": self.total_positions,
+            "title": title
+        } for position, title, content in rows]
+
+    def iter_pages(self):
+        """按顺序遍历全部页面，产生 (position, title, content)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT position, title, content FROM pages ORDER BY position'
+            ).fetchall()
+        return iter(rows)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只使用gzip
+    brotli = None
+
+# 需要压缩的响应类型
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+# 启动时预压缩的静态文件类型
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.json'}
+
+# 静态文件指纹长度
+DIGEST_LENGTH = 12
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class Compressor:
+    """响应压缩和静态文件预压缩
+
+    动态响应（HTML、JSON等）超过阈值时按 Accept-Encoding 使用brotli或gzip压缩；
+    静态文件在启动时计算内容指纹并预先压缩，带指纹的URL返回长期不变的缓存头。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.min_size = 1024
+        self.static_max_age = 31536000
+        self.cache_folder = None
+        self._manifest = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.static_max_age = app.config.get('STATIC_MAX_AGE', self.static_max_age)
+        self.cache_folder = app.config['STATIC_CACHE_FOLDER']
+        app.after_request(self._compress_response)
+        if app.has_static_folder:
+            self.precompress_static()
+            app.url_defaults(self._static_url_defaults)
+            app.view_functions['static'] = self._send_static
+
+    def _accepted_encoding(self, available=('br', 'gzip')):
+        """按客户端声明的 Accept-Encoding 选择编码，优先brotli"""
+        accept = request.accept_encodings
+        for encoding in available:
+            if encoding == 'br' and brotli is None:
+                continue
+            if accept[encoding]:
+                return encoding
+        return None
+
+    def _compress_response(self, response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        encoding = self._accepted_encoding()
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=5))
+        else:
+            response.set_data(_gzip(data, 6))
+        response.headers['Content-Encoding'] = encoding
+        # 压缩后的字节不同，强ETag改为弱ETag，条件请求仍可命中
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def precompress_static(self):
+        """计算全部静态文件的指纹，可压缩的文件预先生成 .gz/.br"""
+        static_folder = self.app.static_folder
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                try:
+                    self._build_entry(filename, path)
+                except OSError as e:
+                    self.app.logger.warning(f"预压缩静态文件 {filename} 出错: {str(e)}")
+
+    def _build_entry(self, filename, path):
+        st = os.stat(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+        encodings = {}
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            compressors = [('gzip', '.gz', lambda d: _gzip(d, 9))]
+            if brotli is not None:
+                compressors.insert(0, ('br', '.br', lambda d: brotli.compress(d, quality=11)))
+            for encoding, suffix, compress in compressors:
+                target = os.path.join(self.cache_folder, f'{filename}.{digest}{suffix}')
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    tmp_path = f'{target}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        f.write(compress(data))
+                    os.replace(tmp_path, target)
+                encodings[encoding] = target
+        entry = {
+            'digest': digest,
+            'source': (st.st_mtime_ns, st.st_size),
+            'encodings': encodings,
+        }
+        with self._lock:
+            self._manifest[filename] = entry
+        return entry
+
+    def _entry(self, filename):
+        """返回静态文件的指纹信息，文件修改后重新计算"""
+        path = safe_join(self.app.static_folder, filename)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self._manifest.get(filename)
+        if entry is None or entry['source'] != (st.st_mtime_ns, st.st_size):
+            entry = self._build_entry(filename, path)
+        return entry
+
+    def _static_url_defaults(self, endpoint, values):
+        """url_for('static', ...) 自动附加内容指纹"""
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        entry = self._entry(values['filename'])
+        if entry is not None:
+            values.setdefault('v', entry['digest'])
+
+    def _send_static(self, filename):
+        entry = self._entry(filename)
+        if entry is None or request.args.get('v') != entry['digest']:
+            return self.app.send_static_file(filename)
+
+        encoding = self._accepted_encoding([e for e in ('br', 'gzip') if e in entry['encodings']])
+        if encoding is not None:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_file(entry['encodings'][encoding], mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = self.app.send_static_file(filename)
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        # 指纹随内容变化，可以永久缓存
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = self.static_max_age
+        response.cache_control.immutable = True
+        return response
+
+
+compressor = Compressor()
@@ -0,0 +1,232 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+from epub_reader import EpubReader
+from models import db, Book
+
+# 缩略图高度（像素），书库中封面高200px，400用于高分屏
+COVER_SIZES = (200, 400)
+
+# 缩略图格式：扩展名 -> (Pillow格式, MIME类型, 保存参数)
+COVER_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+# 封面宽高比 2:3
+COVER_RATIO = 2 / 3
+
+# 占位封面样式变化时递增，生成新的内容哈希
+PLACEHOLDER_VERSION = 1
+
+# 封面生成失败时 Book.cover_path 的取值，书库页面不再重复提交，可用 flask reader warm 重试
+COVER_FAILED = ''
+
+_PLACEHOLDER_COLORS = [
+    (52, 73, 94), (192, 57, 43), (39, 174, 96), (41, 128, 185),
+    (142, 68, 173), (211, 84, 0), (22, 160, 133), (127, 140, 141),
+]
+
+
+def extract_cover(file_path, file_format):
+    """返回书籍自带的封面图片内容，只有EPUB可能带封面"""
+    if file_format != '.epub':
+        return None
+    reader = EpubReader(file_path)
+    try:
+        return reader.cover()
+    finally:
+        reader.close()
+
+
+def _flatten(image):
+    """转换为RGB，透明背景填充为白色"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+class CoverGenerator:
+    """在后台提取书籍封面并生成缩略图
+
+    EPUB使用书中声明的封面图片，PDF、TXT和没有封面的EPUB生成占位封面。
+    缩略图按内容哈希存放，Book.cover_path 保存哈希值；相同封面只生成一次，
+    读取时直接返回缩略图文件，不打开原书。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.folder = None
+        self.font_path = None
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config['COVER_FOLDER']
+        self.font_path = app.config.get('COVER_FONT')
+        self._executor = ThreadPoolExecutor(max_workers=app.config.get('COVER_WORKERS', 2),
+                                            thread_name_prefix='cover')
+
+    def path(self, digest, size, ext):
+        """缩略图的存储路径，按哈希前两位分目录"""
+        return os.path.join(self.folder, digest[:2], f'{digest}_{size}.{ext}')
+
+    def submit(self, book_id):
+        """提交封面生成任务，同一本书已在队列中时忽略"""
+        with self._lock:
+            if book_id in self._pending:
+                return None
+            self._pending.add(book_id)
+        return self._executor.submit(self._generate, book_id)
+
+    def _generate(self, book_id):
+        try:
+            with self.app.app_context():
+                try:
+                    book = Book.query.get(book_id)
+                    if book is None:
+                        return
+                    digest = self.build(book.file_path, book.file_format, book.title)
+                    Book.query.filter_by(id=book_id).update({'cover_path': digest},
+                                                            synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    self.app.logger.error(f"生成书籍 {book_id} 的封面出错: {str(e)}")
+                    db.session.rollback()
+                    Book.query.filter_by(id=book_id, cover_path=None) \
+                        .update({'cover_path': COVER_FAILED}, synchronize_session=False)
+                    db.session.commit()
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._pending.discard(book_id)
+
+    def build(self, file_path, file_format, title):
+        """生成封面缩略图，返回内容哈希"""
+        image = None
+        try:
+            source = extract_cover(file_path, file_format)
+        except Exception as e:
+            print(f"提取封面出错: {str(e)}")
+            source = None
+        if source:
+            digest = hashlib.sha256(source).hexdigest()
+            if self.exists(digest):
+                return digest
+            try:
+                image = Image.open(io.BytesIO(source))
+                # JPEG解码时直接缩小，减少大图的解码开销
+                image.draft('RGB', self._box(max(COVER_SIZES)))
+                image = _flatten(image)
+            except Exception as e:
+                print(f"读取封面图片出错: {str(e)}")
+                image = None
+        if image is None:
+            key = f'placeholder:{PLACEHOLDER_VERSION}:{self.font_path}:{file_format}:{title}'
+            digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+            if self.exists(digest):
+                return digest
+            image = self._render_placeholder(title, file_format, digest)
+        self._write_thumbnails(image, digest)
+        return digest
+
+    @staticmethod
+    def _box(size):
+        return (int(size * COVER_RATIO), size)
+
+    def exists(self, digest):
+        """该封面的全部缩略图是否都已生成"""
+        return all(os.path.exists(self.path(digest, size, ext))
+                   for size in COVER_SIZES for ext in COVER_FORMATS)
+
+    def _write_thumbnails(self, image, digest):
+        # 从大到小依次缩小，每次都基于上一个尺寸
+        for size in sorted(COVER_SIZES, reverse=True):
+            image = image.copy()
+            image.thumbnail(self._box(size), Image.LANCZOS)
+            for ext, (fmt, _, options) in COVER_FORMATS.items():
+                target = self.path(digest, size, ext)
+                if os.path.exists(target):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+                image.save(tmp_path, fmt, **options)
+                os.replace(tmp_path, target)
+
+    def _render_placeholder(self, title, file_format, digest):
+        """按书名和格式绘制占位封面"""
+        width, height = self._box(max(COVER_SIZES))
+        color = _PLACEHOLDER_COLORS[int(digest[:8], 16) % len(_PLACEHOLDER_COLORS)]
+        image = Image.new('RGB', (width, height), color)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, int(height * 0.78), width, height], fill=tuple(c // 2 for c in color))
+
+        label = file_format.lstrip('.').upper()
+        font = self._font(height // 12)
+        if font is not None:
+            self._draw_title(draw, title, font, width, height)
+            draw.text((width // 2, int(height * 0.89)), label, font=font,
+                      fill=(255, 255, 255), anchor='mm')
+        else:
+            # 内置字体只有很小的拉丁字符，只绘制格式名称并放大
+            small = ImageFont.load_default()
+            left, top, right, bottom = draw.textbbox((0, 0), label, font=small)
+            text = Image.new('L', (right - left + 2, bottom - top + 2), 0)
+            ImageDraw.Draw(text).text((1 - left, 1 - top), label, font=small, fill=255)
+            scale = max(1, width // 2 // text.width)
+            text = text.resize((text.width * scale, text.height * scale), Image.NEAREST)
+            image.paste((255, 255, 255), ((width - text.width) // 2, (height - text.height) // 3), text)
+        return image
+
+    def _font(self, size):
+        if not self.font_path:
+            return None
+        try:
+            return ImageFont.truetype(self.font_path, size)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _draw_title(draw, title, font, width, height):
+        """按宽度逐字换行绘制书名，最多四行"""
+        margin = width // 10
+        lines = []
+        line = ''
+        for char in title:
+            if draw.textlength(line + char, font=font) > width - 2 * margin:
+                lines.append(line)
+                line = char
+                if len(lines) == 4:
+                    break
+            else:
+                line += char
+        else:
+            lines.append(line)
+        y = height // 8
+        line_height = int(font.size * 1.4)
+        for line in lines[:4]:
+            draw.text((margin, y), line, font=font, fill=(255, 255, 255))
+            y += line_height
+
+    def remove(self, digest):
+        """删除某个封面的全部缩略图"""
+        for size in COVER_SIZES:
+            for ext in COVER_FORMATS:
+                try:
+                    os.remove(self.path(digest, size, ext))
+                except OSError:
+                    pass
+
+
+covers = CoverGenerator()
@@ -0,0 +1,195 @@
+import posixpath
+import zipfile
+from urllib.parse import unquote
+from xml.etree import ElementTree
+from bs4 import BeautifulSoup
+
+CONTAINER_PATH = 'META-INF/container.xml'
+
+_NS = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'ncx': 'http://www.daisy.org/z3986/2005/ncx/',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+}
+
+# 与ebooklib一致：所有XHTML清单项（包括导航和封面页）都算作文档
+DOCUMENT_MEDIA_TYPE = 'application/xhtml+xml'
+NCX_MEDIA_TYPE = 'application/x-dtbncx+xml'
+
+
+class EpubReader:
+    """按需读取EPUB的轻量读取器
+
+    打开时只解析 container.xml 和 OPF 清单，保存文档列表；
+    读取某一页时只解压对应的一个文件，不加载图片、字体和样式。
+    文档按清单顺序编号，与 ebooklib 的 ITEM_DOCUMENT 顺序一致，已保存的position保持不变。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._zip = zipfile.ZipFile(file_path)
+        try:
+            self._load_package()
+        except Exception:
+            self._zip.close()
+            raise
+
+    def _load_package(self):
+        container = ElementTree.fromstring(self._zip.read(CONTAINER_PATH))
+        opf_path = None
+        for rootfile in container.iter('{%s}rootfile' % _NS['container']):
+            if rootfile.get('media-type') == 'application/oebps-package+xml':
+                opf_path = rootfile.get('full-path')
+                break
+        if not opf_path:
+            raise ValueError('EPUB中找不到OPF文件')
+
+        opf_dir = self.opf_dir = posixpath.dirname(opf_path)
+        package = ElementTree.fromstring(self._zip.read(opf_path))
+        self.title = (package.findtext('opf:metadata/dc:title', '', _NS) or '').strip() or None
+
+        # 文档：(压缩包内路径, 相对OPF的文件名)
+        self.documents = []
+        self.ncx_path = None
+        self.nav_path = None
+        self.cover_path = None
+        manifest_paths = {}
+        images = {}
+        for item in package.iterfind('opf:manifest/opf:item', _NS):
+            href = unquote(item.get('href', ''))
+            path = posixpath.normpath(posixpath.join(opf_dir, href))
+            manifest_paths[item.get('id')] = path
+            media_type = item.get('media-type')
+            properties = item.get('properties', '').split()
+            if media_type == DOCUMENT_MEDIA_TYPE:
+                self.documents.append((path, href))
+                if 'nav' in properties:
+                    self.nav_path = path
+            elif media_type == NCX_MEDIA_TYPE:
+                self.ncx_path = path
+            elif media_type and media_type.startswith('image/'):
+                images[item.get('id')] = path
+                if 'cover-image' in properties and self.cover_path is None:
+                    self.cover_path = path
+
+        # EPUB2在元数据中用 <meta name="cover"> 指向封面图片
+        if self.cover_path is None:
+            for meta in package.iterfind('opf:metadata/opf:meta', _NS):
+                if meta.get('name') == 'cover' and meta.get('content') in images:
+                    self.cover_path = images[meta.get('content')]
+                    break
+        # 都没有声明时，使用id或文件名中带cover的图片
+        if self.cover_path is None:
+            for item_id, path in images.items():
+                if 'cover' in (item_id or '').lower() or 'cover' in posixpath.basename(path).lower():
+                    self.cover_path = path
+                    break
+
+        # 优先使用spine中声明的NCX
+        spine = package.find('opf:spine', _NS)
+        if spine is not None and spine.get('toc') in manifest_paths:
+            self.ncx_path = manifest_paths[spine.get('toc')]
+
+    @property
+    def total_positions(self):
+        return len(self.documents)
+
+    def read(self, path):
+        """解压压缩包中的单个文件"""
+        return self._zip.read(path)
+
+    def document_size(self, position):
+        """文档解压后的字节数，只读取压缩包目录"""
+        return self._zip.getinfo(self.documents[position][0]).file_size
+
+    def read_document(self, position):
+        """返回 (文件名, 内容)，只解压该position对应的文档"""
+        path, name = self.documents[position]
+        return name, self.read(path)
+
+    def cover(self):
+        """返回封面图片的内容，没有封面时返回None"""
+        if self.cover_path is None:
+            return None
+        try:
+            return self.read(self.cover_path)
+        except KeyError:
+            return None
+
+    def toc(self):
+        """解析目录，优先NCX，没有时使用EPUB3导航文档"""
+        if self.ncx_path:
+            try:
+                return self._parse_ncx(self.read(self.ncx_path))
+            except (KeyError, ElementTree.ParseError):
+                pass
+        if self.nav_path:
+            try:
+                return self._parse_nav(self.read(self.nav_path), posixpath.dirname(self.nav_path))
+            except KeyError:
+                pass
+        return []
+
+    def _parse_ncx(self, data):
+        nav_map = ElementTree.fromstring(data).find('ncx:navMap', _NS)
+        if nav_map is None:
+            return []
+
+        def parse_point(point):
+            label = point.find('ncx:navLabel/ncx:text', _NS)
+            content = point.find('ncx:content', _NS)
+            entry = {
+                'title': (label.text or '').strip() if label is not None else '',
+                'href': content.get('src', '') if content is not None else '',
+            }
+            children = [parse_point(child) for child in point.findall('ncx:navPoint', _NS)]
+            return entry, children
+
+        return [_toc_item(entry, children) for entry, children in
+                (parse_point(point) for point in nav_map.findall('ncx:navPoint', _NS))]
+
+    def _parse_nav(self, data, base_path):
+        soup = BeautifulSoup(data, 'html.parser')
+        nav = None
+        for candidate in soup.find_all('nav'):
+            if 'toc' in (candidate.get('epub:type') or '').split():
+                nav = candidate
+                break
+        if nav is None or nav.find('ol') is None:
+            return []
+        opf_dir = self.opf_dir
+
+        def parse_list(ol):
+            items = []
+            for li in ol.find_all('li', recursive=False):
+                link = li.find('a', recursive=False)
+                title_node = link or li.find(['span', 'a'])
+                href = ''
+                if link is not None and link.get('href'):
+                    # 导航文档中的链接相对于导航文件，转换为相对于OPF目录
+                    target = posixpath.normpath(posixpath.join(base_path, unquote(link['href'])))
+                    href = posixpath.relpath(target, opf_dir) if opf_dir else target
+                entry = {
+                    'title': title_node.get_text(strip=True) if title_node is not None else '',
+                    'href': href,
+                }
+                sublist = li.find('ol', recursive=False)
+                items.append((entry, parse_list(sublist) if sublist is not None else []))
+            return items
+
+        return [_toc_item(entry, children) for entry, children in parse_list(nav.find('ol'))]
+
+    def nbytes(self):
+        """估算占用的内存"""
+        return 4096 + sum(len(path) + len(name) + 128 for path, name in self.documents)
+
+    def close(self):
+        self._zip.close()
+
+
+def _toc_item(entry, children):
+    """生成与原目录格式一致的目录项，子目录只保留一层"""
+    if not children:
+        return entry
+    return dict(entry, children=[child for child, _ in children])
@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from models import db, Book, Bookmark, ReadingProgress
+from book_handlers import build_book_store, iter_store_pages, get_legacy_positions, PAGE_SCHEME, CONTENT_VERSION
+from search_index import search_index
+from progress_buffer import progress_buffer
+from covers import covers
+
+# 后台预处理线程池
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('INGEST_WORKERS', 2)),
+                               thread_name_prefix='ingest')
+
+
+def ingest_book(app, book_id):
+    """在后台线程中预处理书籍，并记录处理状态和总页数"""
+    with app.app_context():
+        try:
+            book = Book.query.get(book_id)
+            if book is None:
+                return
+            try:
+                total = build_book_store(book.file_path, book.file_format)
+                # 相同文件已按当前分页建立过索引时跳过
+                if not search_index.is_indexed(book.file_path, CONTENT_VERSION):
+                    search_index.index_book(book.file_path, iter_store_pages(book.file_path),
+                                            CONTENT_VERSION)
+            except Exception as e:
+                app.logger.error(f"预处理书籍 {book_id} 出错: {str(e)}")
+                book.status = Book.STATUS_FAILED
+            else:
+                book.total_positions = total
+                book.status = Book.STATUS_READY
+            db.session.commit()
+            # 封面在单独的线程池中生成，不延迟书籍可读
+            covers.submit(book_id)
+        finally:
+            db.session.remove()
+
+
+def submit_ingest(app, book_id):
+    """提交预处理任务，立即返回Future"""
+    return _executor.submit(ingest_book, app, book_id)
+
+
+def upgrade_positions(book):
+    """把旧分页方案下保存的进度和书签转换为当前分页的position
+
+    先用条件更新标记分页方案，只有标记成功的请求执行转换，避免并发时重复转换。
+    """
+    scheme = book.page_scheme
+    if scheme == PAGE_SCHEME:
+        return False
+    current = Book.page_scheme.is_(None) if scheme is None else Book.page_scheme == scheme
+    # 转换期间暂停进度的批量写入，缓冲中旧分页的进度随后一并转换，避免覆盖转换后的记录
+    with progress_buffer.paused():
+        claimed = Book.query.filter(Book.id == book.id, current) \
+            .update({'page_scheme': PAGE_SCHEME}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            db.session.refresh(book)
+            return False
+        
+        models = (ReadingProgress, Bookmark)
+        used = {model: [p for (p,) in model.query.filter_by(book_id=book.id)
+                        .with_entities(model.position).distinct()] for model in models}
+        mapping = None
+        # 没有保存过位置的书籍不需要转换，避免为计算映射解析全书
+        if any(used.values()) or progress_buffer.has_book(book.id):
+            try:
+                mapping = get_legacy_positions(book.file_path, book.file_format, scheme)
+            except Exception as e:
+                # 文件无法解析时保留原position，越界的位置在读取时回到第一页
+                print(f"转换书籍 {book.id} 的阅读位置出错: {str(e)}")
+        if mapping:
+            convert = lambda p: mapping[p] if 0 <= p < len(mapping) else 0
+            for model in models:
+                if not used[model]:
+                    continue
+                # 一条UPDATE完成转换，不修改更新时间
+                values = {'position': db.case({p: convert(p) for p in used[model]},
+                                              value=model.position, else_=0)}
+                if hasattr(model, 'updated_at'):
+                    values['updated_at'] = model.updated_at
+                model.query.filter_by(book_id=book.id).update(values, synchronize_session=False)
+        db.session.commit()
+        if mapping:
+            progress_buffer.remap_book(book.id, convert)
+    return True
+
+
+def ensure_ingested(app, book):
+    """旧数据中尚未预处理或分页方案已过期的书籍，在首次访问时补充提交任务"""
+    upgraded = upgrade_positions(book)
+    if upgraded or book.status is None:
+        book.status = Book.STATUS_PROCESSING
+        db.session.commit()
+        submit_ingest(app, book.id)
@@ -0,0 +1,223 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pdf_extract
+from book_handlers import build_book_store, build_book_toc, is_toc_current, iter_store_pages, CONTENT_VERSION
+from chunk_store import ChunkStore
+from covers import covers
+from ingest import upgrade_positions
+from models import db, Book
+from search_index import search_index
+from shared_cache import shared_cache
+
+# 派生数据：分块存储的页面文本、目录映射、全文索引、封面缩略图
+ARTIFACTS = ('pages', 'toc', 'search', 'cover')
+
+# 各派生数据的状态
+OK = 'ok'
+STALE = 'stale'
+BUILT = 'built'
+FAILED = 'failed'
+
+MODE_WARM = 'warm'          # 只生成缺失或过期的数据
+MODE_REBUILD = 'rebuild'    # 全部重新生成
+MODE_VERIFY = 'verify'      # 只检查，不生成
+
+
+def _init_worker(config):
+    """工作进程不导入app，只配置派生数据的存放位置"""
+    search_index.path = config['SEARCH_DB']
+    search_index.enabled = config['SEARCH_ENABLED']
+    covers.folder = config['COVER_FOLDER']
+    covers.font_path = config.get('COVER_FONT')
+    # 多个工作进程已占满CPU，PDF直接在工作进程中提取；
+    # 若再启动进程池，池中的子进程不会被关闭，工作进程退出时会一直等待它们
+    pdf_extract.IN_PROCESS = True
+
+
+def _pages_status(file_path):
+    try:
+        store = ChunkStore(file_path)
+    except (OSError, ValueError, KeyError, sqlite3.Error):
+        return STALE, None
+    total = store.total_positions
+    store.close()
+    return OK, total
+
+
+def process_file(task):
+    """在工作进程中检查或生成一个书籍文件的派生数据
+
+    页面、目录和全文索引按文件生成，相同文件的书籍共享；封面按书籍生成。
+    各项数据都先写临时文件或在事务中写入，中断后重新运行时已完成的部分按文件身份跳过。
+    """
+    file_path, file_format = task['file_path'], task['file_format']
+    artifacts, mode = task['artifacts'], task['mode']
+    status, errors, cover_digests = {}, {}, {}
+    total = None
+
+    def step(name, check, build):
+        if name not in artifacts:
+            return
+        try:
+            current = mode != MODE_REBUILD and check()
+            if current or mode == MODE_VERIFY:
+                status[name] = OK if current else STALE
+                return
+            build()
+            status[name] = BUILT
+        except Exception as e:
+            status[name] = FAILED
+            errors[name] = str(e)
+
+    def check_pages():
+        nonlocal total
+        state, total = _pages_status(file_path)
+        return state == OK
+
+    def build_pages():
+        nonlocal total
+        total = build_book_store(file_path, file_format, force=True)
+
+    step('pages', check_pages, build_pages)
+    step('toc', lambda: is_toc_current(file_path),
+         lambda: build_book_toc(file_path, file_format, force=True))
+    # 全文索引从分块存储读取页面，页面数据不可用时无法建立
+    step('search', lambda: search_index.is_indexed(file_path, CONTENT_VERSION),
+         lambda: search_index.index_book(file_path, iter_store_pages(file_path), CONTENT_VERSION))
+
+    if 'cover' in artifacts:
+        for book_id, title, cover_path in task['books']:
+            key = f'cover:{book_id}'
+            try:
+                if mode != MODE_REBUILD and cover_path and covers.exists(cover_path):
+                    status[key] = OK
+                elif mode == MODE_VERIFY:
+                    status[key] = STALE
+                else:
+                    cover_digests[book_id] = covers.build(file_path, file_format, title)
+                    status[key] = BUILT
+            except Exception as e:
+                status[key] = FAILED
+                errors[key] = str(e)
+
+    if total is None and 'pages' not in artifacts:
+        total = _pages_status(file_path)[1]
+    return {
+        'file_path': file_path,
+        'status': status,
+        'errors': errors,
+        'total_positions': total,
+        'covers': cover_digests,
+    }
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    return f'{seconds // 60}m{seconds % 60:02d}s'
+
+
+def _apply_result(result, books, mode):
+    """把生成结果写回书籍记录：总页数、预处理状态、分页方案和封面"""
+    if mode == MODE_VERIFY:
+        return
+    pages = result['status'].get('pages')
+    if pages in (OK, BUILT) and result['total_positions'] is not None:
+        # 页面已按当前分页生成，旧分页方案的书籍先转换进度和书签并记录分页方案，
+        # 避免首次访问时再次升级；转换会单独提交，放在其他修改之前
+        for book in books:
+            upgrade_positions(book)
+    changed = False
+    for book in books:
+        if pages in (OK, BUILT) and result['total_positions'] is not None:
+            if book.total_positions != result['total_positions'] or book.status != Book.STATUS_READY:
+                book.total_positions = result['total_positions']
+                book.status = Book.STATUS_READY
+                changed = True
+        elif pages == FAILED:
+            book.status = Book.STATUS_FAILED
+            changed = True
+        digest = result['covers'].get(book.id)
+        if digest and book.cover_path != digest:
+            book.cover_path = digest
+            changed = True
+    if changed:
+        db.session.commit()
+
+
+def run(app, mode, artifacts=ARTIFACTS, book_ids=None, user_id=None, workers=None, echo=print):
+    """遍历书籍，在多个进程中检查或生成派生数据，返回各状态的计数，需在应用上下文中调用"""
+    query = Book.query.order_by(Book.id)
+    if book_ids:
+        query = query.filter(Book.id.in_(book_ids))
+    if user_id is not None:
+        query = query.filter(Book.user_id == user_id)
+
+    by_file = {}
+    counts = {}
+    for book in query:
+        if not os.path.exists(book.file_path):
+            echo(f'[missing] book {book.id} {book.file_path}')
+            counts['missing'] = counts.get('missing', 0) + 1
+            continue
+        by_file.setdefault(book.file_path, []).append(book)
+    if not by_file:
+        return counts
+
+    tasks = [{
+        'file_path': file_path,
+        'file_format': books[0].file_format,
+        'books': [(b.id, b.title, b.cover_path) for b in books],
+        'artifacts': tuple(artifacts),
+        'mode': mode,
+    } for file_path, books in by_file.items()]
+    total_bytes = sum(os.path.getsize(task['file_path']) for task in tasks)
+
+    config = {key: app.config.get(key) for key in ('SEARCH_DB', 'COVER_FOLDER', 'COVER_FONT')}
+    config['SEARCH_ENABLED'] = search_index.enabled
+    workers = workers or os.cpu_count() or 1
+    # 使用spawn启动工作进程，不继承主进程中的线程和数据库连接
+    context = multiprocessing.get_context('spawn')
+    started = time.monotonic()
+    done_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(config,)) as executor:
+        futures = {executor.submit(process_file, task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file_path': task['file_path'], 'status': {'worker': FAILED},
+                          'errors': {'worker': str(e)}, 'total_positions': None,
+                          'covers': {}}
+            _apply_result(result, by_file[task['file_path']], mode)
+            # 检查时同时核对书籍记录中的总页数
+            if mode == MODE_VERIFY and result['total_positions'] is not None:
+                for book in by_file[task['file_path']]:
+                    if book.total_positions != result['total_positions']:
+                        result['status'][f'positions:{book.id}'] = STALE
+            # 重建后共享缓存中的旧页面不再有效
+            if result['status'].get('pages') == BUILT:
+                shared_cache.invalidate(task['file_path'])
+
+            for state in result['status'].values():
+                counts[state] = counts.get(state, 0) + 1
+            done_bytes += os.path.getsize(task['file_path'])
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed else 0.0
+            eta = (len(tasks) - done) / rate if rate else 0.0
+            mb_rate = done_bytes / elapsed / 1048576 if elapsed else 0.0
+            summary = ', '.join(f'{name}={state}' for name, state in result['status'].items())
+            echo(f'[{done}/{len(tasks)}] {rate:.2f} files/s {mb_rate:.1f} MB/s '
+                 f'ETA {_format_eta(eta)} {task["file_path"]}: {summary}')
+            for name, error in result['errors'].items():
+                echo(f'    {name}: {error}')
+
+    elapsed = time.monotonic() - started
+    echo(f'{len(tasks)} files ({total_bytes / 1048576:.1f} MB) in {_format_eta(elapsed)}')
+    return counts
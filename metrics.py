@@ -0,0 +1,192 @@
+import hmac
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import abort, g, request, has_request_context, Response
+from flask.json import JSONEncoder
+from jinja2 import Template
+from sqlalchemy import event
+
+# 延迟直方图的分桶上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels.items()
+    ) + '}'
+
+
+class Metrics:
+    """请求耗时与分阶段耗时统计，以Prometheus文本格式输出
+
+    阶段包括数据库查询、书籍解析、目录生成、模板渲染和JSON序列化，
+    由 stage() 上下文管理器在请求内累计。
+    /metrics 只允许 allowed_networks 中的地址或携带 token 的请求访问，其他请求返回403。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._request_counts = {}
+        self._stages = {}
+        self._collectors = []
+        self.slow_request_ms = 0
+        self.token = None
+        self.allowed_networks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', 0)
+        self.token = app.config.get('METRICS_TOKEN') or None
+        self.allowed_networks = [ipaddress.ip_network(item.strip(), strict=False)
+                                 for item in (app.config.get('METRICS_ALLOWED_IPS') or '').split(',')
+                                 if item.strip()]
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        # 统计全部模板渲染和JSON序列化的耗时
+        app.jinja_env.template_class = _make_template_class(self)
+        app.json_encoder = _make_json_encoder(self, app.json_encoder)
+
+    def instrument_engine(self, engine):
+        """统计每个请求中SQL语句的执行时间"""
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['query_start'].pop()
+            self.record_stage('db', time.perf_counter() - started)
+
+    def register_collector(self, collector):
+        """注册额外的指标来源，collector() 返回 (名称, 类型, 说明, 值) 列表"""
+        self._collectors.append(collector)
+
+    def record_stage(self, name, seconds):
+        if has_request_context() and hasattr(g, '_metrics_stages'):
+            g._metrics_stages[name] = g._metrics_stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """记录一段代码的耗时并计入当前请求的指定阶段"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - started)
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_stages = {}
+
+    def _after_request(self, response):
+        started = getattr(g, '_metrics_start', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        stages = g._metrics_stages
+
+        with self._lock:
+            self._requests.setdefault((route, request.method), Histogram()).observe(elapsed)
+            key = (route, request.method, response.status_code)
+            self._request_counts[key] = self._request_counts.get(key, 0) + 1
+            for name, seconds in stages.items():
+                self._stages.setdefault((route, name), Histogram()).observe(seconds)
+
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            breakdown = ', '.join(f'{name}={seconds * 1000:.1f}ms'
+                                  for name, seconds in sorted(stages.items()))
+            self.app.logger.warning(
+                f"慢请求 {request.method} {request.path} {response.status_code} "
+                f"{elapsed * 1000:.1f}ms [{breakdown}]"
+            )
+        return response
+
+    def _authorized(self):
+        if self.token:
+            header = request.headers.get('Authorization', '')
+            if hmac.compare_digest(header.encode('utf-8'), f'Bearer {self.token}'.encode('utf-8')):
+                return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def export(self):
+        """以Prometheus文本格式输出全部指标"""
+        if not self._authorized():
+            abort(403)
+        lines = []
+        with self._lock:
+            lines += self._format_histograms(
+                'reader_request_duration_seconds', '请求处理耗时',
+                {_labels(route=r, method=m): h for (r, m), h in self._requests.items()})
+            lines += self._format_histograms(
+                'reader_stage_duration_seconds', '请求内各阶段耗时',
+                {_labels(route=r, stage=s): h for (r, s), h in self._stages.items()})
+            lines.append('# HELP reader_requests_total 请求数')
+            lines.append('# TYPE reader_requests_total counter')
+            for (route, method, status), count in sorted(self._request_counts.items()):
+                lines.append(f'reader_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _format_histograms(name, help_text, histograms):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, hist in sorted(histograms.items()):
+            cumulative = 0
+            base = labels[:-1]
+            for bound, count in zip(BUCKETS + (float('inf'),), hist.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{base},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{labels} {hist.total}')
+            lines.append(f'{name}_count{labels} {hist.count}')
+        return lines
+
+
+def _make_template_class(metrics):
+    class TimedTemplate(Template):
+        def render(self, *args, **kwargs):
+            with metrics.stage('template_render'):
+                return super().render(*args, **kwargs)
+    return TimedTemplate
+
+
+def _make_json_encoder(metrics, base=JSONEncoder):
+    class TimedJSONEncoder(base):
+        def encode(self, o):
+            with metrics.stage('json_serialize'):
+                return super().encode(o)
+    return TimedJSONEncoder
+
+
+metrics = Metrics()
@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
@@ -26,6 +27,11 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 class Book(db.Model):
+    # 预处理状态
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
@@ -34,10 +40,22 @@ class Book(db.Model):
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_read_at = db.Column(db.DateTime)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20))  # 预处理状态，旧数据为空
+    total_positions = db.Column(db.Integer)  # 预处理后得到的总页数
+    content_hash = db.Column(db.String(64))  # 文件内容的SHA-256，相同内容共享存储
+    page_scheme = db.Column(db.Integer)  # 进度和书签position所用的分页方案，旧数据为空
     
     bookmarks = db.relationship('Bookmark', backref='book', lazy=True)
     reading_progress = db.relationship('ReadingProgress', backref='book', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_book_user_id', 'user_id'),
+        db.Index('ix_book_file_path', 'file_path'),
+        # 书库分页排序使用
+        db.Index('ix_book_user_last_read', 'user_id', 'last_read_at', 'id'),
+        db.Index('ix_book_user_title', 'user_id', 'title', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Book {self.title}>'
 
@@ -46,9 +64,18 @@ class Bookmark(db.Model):
     title = db.Column(db.String(200))
     position = db.Column(db.Integer, nullable=False)  # 在书中的位置
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 同步时按更新时间返回变化
+    deleted = db.Column(db.Boolean, nullable=False, default=False)  # 删除标记，其他设备同步后才能得知删除
+    client_key = db.Column(db.String(64))  # 客户端生成的书签标识，重试同一批修改时不会重复创建
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_bookmark_user_book', 'user_id', 'book_id'),
+        db.Index('ix_bookmark_user_updated', 'user_id', 'updated_at'),
+        db.Index('uq_bookmark_user_client_key', 'user_id', 'client_key', unique=True),
+    )
+    
     def __repr__(self):
         return f'<Bookmark {self.title} at position {self.position}>'
 
@@ -59,5 +86,116 @@ class ReadingProgress(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     
+    # 每个用户对每本书只保留一条进度；用唯一索引实现，旧数据库可以直接补建
+    __table_args__ = (
+        db.Index('uq_reading_progress_user_book', 'user_id', 'book_id', unique=True),
+        db.Index('ix_reading_progress_user_updated', 'user_id', 'updated_at'),
+    )
+    
     def __repr__(self):
-        return f'<ReadingProgress for Book {self.book_id} at position {self.position}>'
\ No newline at end of file
+        return f'<ReadingProgress for Book {self.book_id} at position {self.position}>'
+
+class ReadingEvent(db.Model):
+    """阅读器定时保存进度时记录的事件，只追加不修改，由后台任务汇总"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_reading_event_book_id', 'book_id'),
+    )
+
+class DailyReading(db.Model):
+    """按用户、书籍和日期（UTC）汇总的阅读时长"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    seconds = db.Column(db.Integer, nullable=False, default=0)
+    events = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('uq_daily_reading_user_book_day', 'user_id', 'book_id', 'day', unique=True),
+        db.Index('ix_daily_reading_user_day', 'user_id', 'day'),
+    )
+
+class UserReadingStats(db.Model):
+    """每个用户的累计阅读统计，以及计算时长所需的上一次事件时间"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_seconds = db.Column(db.Integer, nullable=False, default=0)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    last_event_at = db.Column(db.DateTime)
+
+class RollupState(db.Model):
+    """后台汇总任务已处理到的事件id"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+
+# 旧数据库缺少的列：(表名, 列名, 列定义)
+_ADDED_COLUMNS = [
+    ('book', 'status', 'VARCHAR(20)'),
+    ('book', 'total_positions', 'INTEGER'),
+    ('book', 'content_hash', 'VARCHAR(64)'),
+    ('book', 'page_scheme', 'INTEGER'),
+    ('bookmark', 'updated_at', 'DATETIME'),
+    ('bookmark', 'deleted', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ('bookmark', 'client_key', 'VARCHAR(64)'),
+]
+
+def upgrade_schema():
+    """为已有的数据库补充新增的列和索引，需在应用上下文中调用"""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, column, ddl in _ADDED_COLUMNS:
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        
+        # 旧书签没有更新时间，使用创建时间
+        conn.execute(db.text('UPDATE bookmark SET updated_at = created_at WHERE updated_at IS NULL'))
+        
+        # 建唯一索引前清理重复的阅读进度，保留最新的一条
+        progress_indexes = {i['name'] for i in inspector.get_indexes('reading_progress')}
+        if 'uq_reading_progress_user_book' not in progress_indexes:
+            conn.execute(db.text(
+                'DELETE FROM reading_progress WHERE id NOT IN '
+                '(SELECT MAX(id) FROM reading_progress GROUP BY user_id, book_id)'
+            ))
+        
+        for model in (Book, Bookmark, ReadingProgress, ReadingEvent, DailyReading):
+            for index in model.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+# 可选的SQLite调优参数；忙等待时间由 sqlite_engine_options 的连接参数 timeout 设置
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+def sqlite_engine_options(busy_timeout=5.0, pool_size=10, max_overflow=20):
+    """SQLite调优时使用的引擎参数，连接池允许跨线程复用连接"""
+    from sqlalchemy.pool import QueuePool
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_pre_ping': False,
+        'connect_args': {'timeout': busy_timeout, 'check_same_thread': False},
+    }
+
+def enable_sqlite_tuning(engine, pragmas=None):
+    """在每个新连接上应用PRAGMA设置，WAL模式下读操作不会被写入阻塞"""
+    if engine.dialect.name != 'sqlite':
+        return
+    values = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+    
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in values.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
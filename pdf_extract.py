@@ -0,0 +1,116 @@
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from PyPDF2 import PdfFileReader
+
+# 单页提取的时间预算（秒）
+PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', 5))
+
+# 提取进程数，默认使用全部CPU
+WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', 0)) or os.cpu_count() or 1
+
+# 每个任务处理的页数，兼顾调度开销和负载均衡
+BATCH_SIZE = int(os.getenv('PDF_EXTRACT_BATCH', 16))
+
+# 提取超时或失败时的占位文字
+PLACEHOLDER = '[第 {page} 页内容暂时无法提取]'
+
+# 在当前进程的主线程中直接提取，不启动进程池；用于本身已在工作进程中运行的批量任务
+IN_PROCESS = False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class _PageTimeout(BaseException):
+    """继承BaseException，避免被PyPDF2内部的 except Exception 吞掉"""
+
+
+def _on_alarm(signum, frame):
+    raise _PageTimeout()
+
+
+def _extract_range(file_path, start, end, page_timeout):
+    """在子进程中提取 [start, end) 页的文本，单页超时或出错时使用占位文字"""
+    # 子进程中用定时器信号限制单页耗时（Windows不支持，依赖父进程的整体超时）
+    use_alarm = hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+
+    texts = []
+    with open(file_path, 'rb') as f:
+        pdf = PdfFileReader(f)
+        for position in range(start, end):
+            try:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                texts.append(pdf.getPage(position).extractText())
+            except (Exception, _PageTimeout):
+                texts.append(PLACEHOLDER.format(page=position + 1))
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+    return texts
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def page_count(file_path):
+    with open(file_path, 'rb') as f:
+        return PdfFileReader(f).getNumPages()
+
+
+def extract_pages(file_path, num_pages=None, page_timeout=PAGE_TIMEOUT):
+    """并行提取PDF全部页面的文本，返回按页排列的列表"""
+    if num_pages is None:
+        num_pages = page_count(file_path)
+    if IN_PROCESS:
+        return _extract_range(file_path, 0, num_pages, page_timeout)
+    pool = _get_pool()
+    batches = [(start, min(start + BATCH_SIZE, num_pages))
+               for start in range(0, num_pages, BATCH_SIZE)]
+    futures = [(start, end, pool.submit(_extract_range, file_path, start, end, page_timeout))
+               for start, end in batches]
+
+    texts = []
+    broken = False
+    for start, end, future in futures:
+        try:
+            # 子进程内已按页限时，这里的整体超时只用于兜底
+            texts.extend(future.result(timeout=(end - start) * page_timeout + 30))
+        except (TimeoutError, BrokenProcessPool, OSError) as e:
+            broken = broken or isinstance(e, BrokenProcessPool)
+            texts.extend(PLACEHOLDER.format(page=p + 1) for p in range(start, end))
+    if broken:
+        _reset_pool()
+    return texts
+
+
+def extract_page(file_path, position, page_timeout=PAGE_TIMEOUT):
+    """在进程池中提取单页文本，不占用请求线程的CPU"""
+    if IN_PROCESS:
+        return _extract_range(file_path, position, position + 1, page_timeout)[0]
+    try:
+        future = _get_pool().submit(_extract_range, file_path, position, position + 1, page_timeout)
+        return future.result(timeout=page_timeout + 5)[0]
+    except BrokenProcessPool:
+        _reset_pool()
+    except TimeoutError:
+        pass
+    return PLACEHOLDER.format(page=position + 1)
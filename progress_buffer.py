@@ -0,0 +1,227 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Book, ReadingProgress, ReadingEvent
+
+# 每条upsert语句包含的行数
+UPSERT_CHUNK_SIZE = 200
+
+
+class ProgressBuffer:
+    """阅读进度的写回缓冲
+
+    同一 (user_id, book_id) 的多次保存只保留最新位置，
+    按时间间隔或积压数量批量写入数据库，一次事务完成。
+    每次保存同时记为一条阅读事件，随同一批次追加写入，用于统计阅读时长。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = 5.0
+        self.max_pending = 500
+        self._pending = {}
+        self._flushing = {}
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pending_received = 0
+        self.received = 0
+        self.flushed_received = 0
+        self.written = 0
+        self.flushes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('PROGRESS_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('PROGRESS_FLUSH_MAX_PENDING', self.max_pending)
+        # 进程退出前写入剩余的进度
+        atexit.register(self.flush)
+
+    def add(self, user_id, book_id, position):
+        """记录一次进度保存，只保留最新位置"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._pending[(user_id, book_id)] = (position, now)
+            self._events.append((user_id, book_id, position, now))
+            self._pending_received += 1
+            self.received += 1
+            over_limit = len(self._events) >= self.max_pending
+        self._ensure_thread()
+        if over_limit:
+            self._wakeup.set()
+
+    def pending_for_user(self, user_id):
+        """返回某用户尚未写入数据库的进度：{book_id: (position, 保存时间)}，包括正在写入的批次"""
+        with self._lock:
+            result = {book_id: item for (uid, book_id), item in self._flushing.items() if uid == user_id}
+            result.update((book_id, item) for (uid, book_id), item in self._pending.items() if uid == user_id)
+        return result
+
+    def get(self, user_id, book_id):
+        """返回尚未写入数据库的进度位置，没有则返回None"""
+        with self._lock:
+            item = self._pending.get((user_id, book_id)) or self._flushing.get((user_id, book_id))
+        return item[0] if item else None
+
+    def discard_book(self, book_id):
+        """删除书籍时丢弃其未写入的进度"""
+        with self._lock:
+            for key in [k for k in self._pending if k[1] == book_id]:
+                del self._pending[key]
+            self._flushing = {k: v for k, v in self._flushing.items() if k[1] != book_id}
+            self._events = [e for e in self._events if e[1] != book_id]
+
+    @contextmanager
+    def paused(self):
+        """暂停批量写入，等待正在写入的批次完成；期间修改的记录不会被随后写入的旧数据覆盖"""
+        with self._flush_lock:
+            yield
+
+    def has_book(self, book_id):
+        """某本书是否有尚未写入的进度"""
+        with self._lock:
+            return any(key[1] == book_id for key in self._pending)
+
+    def remap_book(self, book_id, convert):
+        """分页方案变化时用 convert 转换某本书尚未写入的进度和阅读事件的position"""
+        with self._lock:
+            for key, (position, saved_at) in list(self._pending.items()):
+                if key[1] == book_id:
+                    self._pending[key] = (convert(position), saved_at)
+            self._events = [(user_id, bid, convert(position) if bid == book_id else position, saved_at)
+                            for user_id, bid, position, saved_at in self._events]
+
+    def flush(self):
+        """将积压的进度批量写入数据库，返回写入条数"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                batch_received, self._pending_received = self._pending_received, 0
+                # 提交前仍可通过 get/pending_for_user 读到这一批进度
+                self._flushing = batch if self.app is not None else {}
+            if not batch or self.app is None:
+                return 0
+            try:
+                with self.app.app_context():
+                    try:
+                        self._write(batch, events)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.app.logger.error(f"批量保存阅读进度出错: {str(e)}")
+                # 放回未被新数据覆盖的条目，等待下次重试
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._events[:0] = events
+                    self._pending_received += batch_received
+                    self._flushing = {}
+                return 0
+            with self._lock:
+                self._flushing = {}
+            self.flushed_received += batch_received
+            self.written += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def _write(self, batch, events=()):
+        keys = list(batch)
+        # 跳过已被删除的书籍
+        book_ids = {book_id for _, book_id in keys}
+        existing_books = {
+            row[0] for row in db.session.query(Book.id).filter(Book.id.in_(book_ids))
+        }
+        values = [
+            {'user_id': user_id, 'book_id': book_id, 'position': position, 'updated_at': saved_at}
+            for (user_id, book_id), (position, saved_at) in batch.items()
+            if book_id in existing_books
+        ]
+        if db.engine.dialect.name == 'sqlite':
+            self._upsert_sqlite(values)
+        else:
+            self._upsert_generic(values)
+        
+        # 阅读事件只追加
+        event_rows = [
+            {'user_id': user_id, 'book_id': book_id, 'position': position, 'created_at': saved_at}
+            for user_id, book_id, position, saved_at in events
+            if book_id in existing_books
+        ]
+        if event_rows:
+            db.session.execute(ReadingEvent.__table__.insert(), event_rows)
+
+        last_read = {}
+        for item in values:
+            book_id, saved_at = item['book_id'], item['updated_at']
+            last_read[book_id] = max(saved_at, last_read.get(book_id, saved_at))
+
+        for book_id, saved_at in last_read.items():
+            Book.query.filter_by(id=book_id).update({'last_read_at': saved_at})
+        db.session.commit()
+
+    def _upsert_sqlite(self, values):
+        """依赖 (user_id, book_id) 唯一索引的 INSERT ... ON CONFLICT 批量写入"""
+        table = ReadingProgress.__table__
+        # 控制单条语句的参数数量
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            stmt = sqlite_insert(table).values(values[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'book_id'],
+                set_={'position': stmt.excluded.position, 'updated_at': stmt.excluded.updated_at},
+            )
+            db.session.execute(stmt)
+
+    def _upsert_generic(self, values):
+        """其他数据库：一次查询已有记录，再逐条更新或插入"""
+        keys = [(item['user_id'], item['book_id']) for item in values]
+        if not keys:
+            return
+        rows = ReadingProgress.query.filter(
+            tuple_(ReadingProgress.user_id, ReadingProgress.book_id).in_(keys)
+        ).all()
+        by_key = {(row.user_id, row.book_id): row for row in rows}
+        for item in values:
+            row = by_key.get((item['user_id'], item['book_id']))
+            if row is None:
+                db.session.add(ReadingProgress(**item))
+            else:
+                row.position = item['position']
+                row.updated_at = item['updated_at']
+
+    def stats(self):
+        """返回缓冲统计，coalescing_ratio 为已写入批次中收到的保存次数与写入行数之比"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'received': self.received,
+            'written': self.written,
+            'flushes': self.flushes,
+            'coalescing_ratio': (self.flushed_received / self.written) if self.written else 0.0,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='progress-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+progress_buffer = ProgressBuffer()
@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from models import db, ReadingEvent, DailyReading, UserReadingStats, RollupState
+
+# 汇总任务在 RollupState 中的名称
+ROLLUP_NAME = 'reading_events'
+
+# 每批汇总的事件数
+ROLLUP_BATCH_SIZE = 5000
+
+
+def format_duration(seconds):
+    """把秒数格式化为 '15h 30m' 形式"""
+    minutes = seconds // 60
+    return f'{minutes // 60}h {minutes % 60}m'
+
+
+class ReadingStatsRollup:
+    """把阅读事件汇总为按日的阅读时长和用户累计统计
+
+    同一用户相邻两次事件间隔不超过 session_gap 时，间隔计入后一次事件所在书籍和日期的阅读时长；
+    超过时视为新的阅读会话。先用条件更新认领一批事件再写汇总表，多个进程同时运行也不会重复计算。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 60.0
+        self.session_gap = 120
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('STATS_ROLLUP_INTERVAL', self.interval)
+        self.session_gap = app.config.get('READING_SESSION_GAP', self.session_gap)
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='stats-rollup', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    try:
+                        while self.rollup() == ROLLUP_BATCH_SIZE:
+                            pass
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.app.logger.error(f"汇总阅读统计出错: {str(e)}")
+
+    def _state(self):
+        state = RollupState.query.get(ROLLUP_NAME)
+        if state is None:
+            try:
+                db.session.add(RollupState(name=ROLLUP_NAME, last_event_id=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            state = RollupState.query.get(ROLLUP_NAME)
+        return state
+
+    def rollup(self):
+        """汇总一批新事件，返回处理的事件数，需在应用上下文中调用"""
+        last_id = self._state().last_event_id
+        events = ReadingEvent.query.filter(ReadingEvent.id > last_id) \
+            .order_by(ReadingEvent.id).limit(ROLLUP_BATCH_SIZE).all()
+        if not events:
+            return 0
+
+        # 认领这批事件，其他进程已处理时放弃
+        claimed = RollupState.query.filter_by(name=ROLLUP_NAME, last_event_id=last_id) \
+            .update({'last_event_id': events[-1].id}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return 0
+
+        user_ids = {e.user_id for e in events}
+        totals = {s.user_id: s for s in
+                  UserReadingStats.query.filter(UserReadingStats.user_id.in_(user_ids))}
+        daily = {}
+        for e in events:
+            stats = totals.get(e.user_id)
+            if stats is None:
+                stats = totals[e.user_id] = UserReadingStats(user_id=e.user_id, total_seconds=0, sessions=0)
+                db.session.add(stats)
+            seconds = 0
+            if stats.last_event_at is None:
+                stats.sessions += 1
+            else:
+                gap = (e.created_at - stats.last_event_at).total_seconds()
+                if gap > self.session_gap:
+                    stats.sessions += 1
+                elif gap > 0:
+                    seconds = int(gap)
+            if stats.last_event_at is None or e.created_at > stats.last_event_at:
+                stats.last_event_at = e.created_at
+            stats.total_seconds += seconds
+
+            key = (e.user_id, e.book_id, e.created_at.date())
+            item = daily.setdefault(key, [0, 0])
+            item[0] += seconds
+            item[1] += 1
+
+        existing = {(row.user_id, row.book_id, row.day): row for row in DailyReading.query.filter(
+            tuple_(DailyReading.user_id, DailyReading.book_id, DailyReading.day).in_(list(daily)))}
+        for (user_id, book_id, day), (seconds, count) in daily.items():
+            row = existing.get((user_id, book_id, day))
+            if row is None:
+                db.session.add(DailyReading(user_id=user_id, book_id=book_id, day=day,
+                                            seconds=seconds, events=count))
+            else:
+                row.seconds += seconds
+                row.events += count
+        db.session.commit()
+        return len(events)
+
+
+def get_user_stats(user_id, days=7):
+    """从汇总表读取用户的累计统计和最近几天的阅读时长"""
+    stats = UserReadingStats.query.get(user_id)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    per_day = dict(
+        db.session.query(DailyReading.day, db.func.sum(DailyReading.seconds))
+        .filter(DailyReading.user_id == user_id, DailyReading.day >= since)
+        .group_by(DailyReading.day)
+    )
+    return {
+        'total_seconds': stats.total_seconds if stats else 0,
+        'sessions': stats.sessions if stats else 0,
+        'daily': [
+            {'date': (since + timedelta(days=i)).isoformat(),
+             'seconds': int(per_day.get(since + timedelta(days=i), 0))}
+            for i in range(days)
+        ],
+    }
+
+
+stats_rollup = ReadingStatsRollup()
@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+from markupsafe import escape
+
+# trigram分词需要SQLite 3.34及以上
+_MIN_SQLITE_VERSION = (3, 34, 0)
+# 少于3个字符的查询无法使用trigram索引，改用二元分词索引
+_MIN_TRIGRAM_LENGTH = 3
+_SNIPPET_CHARS = 40
+# 摘要中标记命中位置的占位符，转义后再替换为<mark>标签
+_MARK_START = '\x01'
+_MARK_END = '\x02'
+
+
+class SearchIndex:
+    """基于SQLite FTS5的全文索引
+
+    每本书的每个position一行，doc 为书籍文件路径，相同文件只索引一次。
+    使用trigram分词以支持中文子串检索；一两个字的查询（常见的中文词）
+    使用另一张二元分词的无内容表 grams，rowid 与 pages 相同。
+    SQLite版本过低、不支持FTS5或trigram时关闭搜索，其余功能不受影响。
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.enabled = False
+        self._write_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config['SEARCH_DB']
+        if sqlite3.sqlite_version_info < _MIN_SQLITE_VERSION:
+            app.logger.warning(f'SQLite {sqlite3.sqlite_version} 不支持trigram分词，全文搜索已关闭')
+            return
+        try:
+            self._create_tables()
+        except sqlite3.OperationalError as e:
+            app.logger.warning(f'无法创建全文索引，全文搜索已关闭: {str(e)}')
+            return
+        self.enabled = True
+
+    def _create_tables(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5("
+                    "content, title UNINDEXED, doc UNINDEXED, position UNINDEXED, "
+                    "tokenize='trigram')"
+                )
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'grams'"
+                ).fetchone()
+                if not exists:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE grams USING fts5("
+                        "content, content='', tokenize='unicode61', detail='none')"
+                    )
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS docs ('
+                    'doc TEXT PRIMARY KEY, source_mtime_ns INTEGER, source_size INTEGER, '
+                    'version INTEGER)'
+                )
+                # 旧索引库补充分页版本列
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(docs)')}
+                if 'version' not in columns:
+                    conn.execute('ALTER TABLE docs ADD COLUMN version INTEGER')
+                # 旧索引库没有二元分词索引，全部书籍需要重新索引
+                if not exists:
+                    conn.execute('DELETE FROM docs')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def is_indexed(self, file_path, version=None):
+        """判断文件的当前版本是否已经按指定的分页版本建立索引，搜索关闭时视为已索引"""
+        if not self.enabled:
+            return True
+        st = os.stat(file_path)
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT source_mtime_ns, source_size, version FROM docs WHERE doc = ?', (file_path,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row is not None and tuple(row) == (st.st_mtime_ns, st.st_size, version)
+
+    def index_book(self, file_path, pages, version=None):
+        """重建一本书的索引，pages 为 (position, title, content) 的可迭代对象"""
+        if not self.enabled:
+            return
+        st = os.stat(file_path)
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._delete_doc(conn, file_path)
+                    for position, title, content in pages:
+                        rowid = conn.execute(
+                            'INSERT INTO pages (content, title, doc, position) VALUES (?, ?, ?, ?)',
+                            (content, title, file_path, position)
+                        ).lastrowid
+                        conn.execute('INSERT INTO grams (rowid, content) VALUES (?, ?)',
+                                     (rowid, _bigrams(content)))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)',
+                        (file_path, st.st_mtime_ns, st.st_size, version)
+                    )
+            finally:
+                conn.close()
+
+    def remove_book(self, file_path):
+        """删除一本书的全部索引"""
+        if not self.enabled:
+            return
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._delete_doc(conn, file_path)
+                    conn.execute('DELETE FROM docs WHERE doc = ?', (file_path,))
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _delete_doc(conn, file_path):
+        # 无内容表只能用原来的分词文本删除，由 pages 中保存的原文重新生成
+        rows = conn.execute('SELECT rowid, content FROM pages WHERE doc = ?', (file_path,)).fetchall()
+        conn.executemany(
+            "INSERT INTO grams (grams, rowid, content) VALUES ('delete', ?, ?)",
+            ((rowid, _bigrams(content)) for rowid, content in rows)
+        )
+        conn.execute('DELETE FROM pages WHERE doc = ?', (file_path,))
+
+    def search(self, file_paths, query, limit=20):
+        """在指定的书籍文件中检索，返回按相关度排序的 (doc, position, title, snippet)"""
+        query = (query or '').strip()
+        file_paths = list(file_paths)
+        if not self.enabled or not query or not file_paths:
+            return []
+
+        placeholders = ','.join('?' * len(file_paths))
+        conn = self._connect()
+        try:
+            if len(query) >= _MIN_TRIGRAM_LENGTH:
+                # 整体作为短语匹配，避免用户输入被解析为FTS语法
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = conn.execute(
+                    "SELECT doc, position, title, snippet(pages, 0, ?, ?, '...', 24) "
+                    f"FROM pages WHERE pages MATCH ? AND doc IN ({placeholders}) "
+                    "ORDER BY rank LIMIT ?",
+                    [_MARK_START, _MARK_END, phrase] + file_paths + [limit]
+                ).fetchall()
+                return [(doc, position, title, _highlight(snippet))
+                        for doc, position, title, snippet in rows]
+
+            if query.isalnum():
+                # 两个字按词条精确匹配；一个字按前缀匹配以该字开头的二元词条
+                term = f'"{query}"' if len(query) > 1 else f'"{query}"*'
+                rows = conn.execute(
+                    "SELECT pages.doc, pages.position, pages.title, pages.content "
+                    "FROM grams JOIN pages ON pages.rowid = grams.rowid "
+                    f"WHERE grams MATCH ? AND pages.doc IN ({placeholders}) LIMIT ?",
+                    [term] + file_paths + [limit]
+                ).fetchall()
+            else:
+                # 含标点等不参与分词的字符时只能逐行扫描
+                rows = conn.execute(
+                    f"SELECT doc, position, title, content FROM pages "
+                    f"WHERE doc IN ({placeholders}) AND instr(content, ?) > 0 LIMIT ?",
+                    file_paths + [query, limit]
+                ).fetchall()
+            return [(doc, position, title, _highlight(_make_snippet(content, query)))
+                    for doc, position, title, content in rows]
+        finally:
+            conn.close()
+
+
+def _bigrams(text):
+    """把文本中连续的字母数字切成相邻两个字的词条，每段末尾的单字也作为词条，空格分隔
+
+    分词器不区分大小写，查询时两个字的词条精确匹配，一个字的查询按前缀匹配。
+    """
+    terms = []
+    run = []
+    for char in text + ' ':
+        if char.isalnum():
+            run.append(char)
+            continue
+        if run:
+            terms.extend(a + b for a, b in zip(run, run[1:]))
+            terms.append(run[-1])
+            run = []
+    return ' '.join(terms)
+
+
+def _make_snippet(content, query):
+    """截取匹配位置附近的文字作为摘要，匹配不区分大小写"""
+    index = max(content.lower().find(query.lower()), 0)
+    end_match = index + len(query)
+    start = max(0, index - _SNIPPET_CHARS)
+    end = end_match + _SNIPPET_CHARS
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if end < len(content) else ''
+    return (prefix + content[start:index] + _MARK_START + content[index:end_match] + _MARK_END
+            + content[end_match:end] + suffix)
+
+
+def _highlight(snippet):
+    """转义摘要中的HTML，再把命中位置替换为<mark>标签"""
+    return str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+search_index = SearchIndex()
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 命中后超过该时间（秒）才更新访问时间，避免每次读取都写数据库
+_TOUCH_INTERVAL = 60
+
+# 超出预算时淘汰到预算的该比例，避免每次写入都触发淘汰
+_EVICT_TARGET = 0.9
+
+
+class SharedCache:
+    """多个工作进程共享的磁盘缓存，存放已提取的页面内容
+
+    基于SQLite（WAL模式），各进程可以同时读取；每次写入在单个事务中完成，
+    按总字节数淘汰最久未访问的条目。键由书籍文件身份和position组成，
+    文件被替换后旧条目不再命中，随淘汰清除。
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.max_bytes = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config['SHARED_CACHE_DB']
+        self.max_bytes = app.config.get('SHARED_CACHE_MAX_BYTES', 0)
+        if not self.enabled:
+            return
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, path TEXT, value TEXT, size INTEGER, accessed REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_path ON entries (path)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+            conn.execute(
+                "INSERT OR IGNORE INTO meta VALUES ('total_bytes', "
+                "(SELECT COALESCE(SUM(size), 0) FROM entries))"
+            )
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.max_bytes > 0
+
+    def _connect(self):
+        """每个线程一个连接，fork后的子进程重新连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """返回缓存的值，未命中或缓存不可用时返回None"""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT value, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                with self._stats_lock:
+                    self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] > _TOUCH_INTERVAL:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            with self._stats_lock:
+                self.hits += 1
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"读取共享缓存出错: {str(e)}")
+            return None
+
+    def put(self, key, file_path, value):
+        """写入一个条目，超出预算时淘汰最久未访问的条目"""
+        if not self.enabled:
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                             (key, file_path, data, size, time.time()))
+                total = self._add_total(conn, size - (old[0] if old else 0))
+                if total > self.max_bytes:
+                    self._evict(conn, total - int(self.max_bytes * _EVICT_TARGET))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"写入共享缓存出错: {str(e)}")
+
+    @staticmethod
+    def _add_total(conn, delta):
+        conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_bytes'", (delta,))
+        return conn.execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    def _evict(self, conn, over):
+        """按访问时间从旧到新删除条目，直到释放 over 字节"""
+        freed = 0
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            keys.append(key)
+            freed += size
+            if freed >= over:
+                break
+        conn.executemany('DELETE FROM entries WHERE key = ?', ((key,) for key in keys))
+        self._add_total(conn, -freed)
+        with self._stats_lock:
+            self.evictions += len(keys)
+
+    def invalidate(self, file_path):
+        """删除某个文件的全部缓存条目"""
+        if not self.enabled:
+            return
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                freed = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries WHERE path = ?',
+                                     (file_path,)).fetchone()[0]
+                conn.execute('DELETE FROM entries WHERE path = ?', (file_path,))
+                self._add_total(conn, -freed)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"清除共享缓存出错: {str(e)}")
+
+    def stats(self):
+        """返回本进程的命中统计和共享缓存的总字节数"""
+        total = 0
+        if self.enabled:
+            try:
+                total = self._connect().execute(
+                    "SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        lookups = self.hits + self.misses
+        return {
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+shared_cache = SharedCache()
@@ -32,6 +32,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // 翻页按键节流，保证响应灵敏且避免过度触发
     let lastPageKeyTime = 0;
     const PAGE_KEY_THROTTLE_MS = 150;
+    // 已预取的页面缓存，顺序阅读时下一页无需等待请求
+    const pageCache = new Map();
+    const PAGE_PREFETCH_COUNT = 3;
+    const PAGE_CACHE_LIMIT = 30;
+    let prefetchingFrom = null;
     
     // 初始化字体大小
     if (localStorage.getItem('fontSize')) {
@@ -466,103 +471,220 @@ async function fetchData() {
         }, 100);
     }
     
+    // 进度和书签的同步：本地修改先放入队列，通过 /api/sync 一次提交并取回其他设备的变化
+    const SYNC_DEBOUNCE_MS = 2000;
+    const SYNC_INTERVAL_MS = 30000;
+    const syncClientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    const bookmarks = new Map();
+    let syncCursor = null;
+    let syncQueue = [];
+    let syncTimer = null;
+    let syncing = null;
+    let remotePosition = null;
+    let bookmarkSeq = 0;
+    
+    // 同一本书的进度只保留最新一条
+    function queueChange(change) {
+        if (change.type === 'progress') {
+            syncQueue = syncQueue.filter(item => item.type !== 'progress' || item.book_id !== change.book_id);
+        }
+        syncQueue.push(change);
+    }
+    
+    function scheduleSync(delay) {
+        clearTimeout(syncTimer);
+        syncTimer = setTimeout(syncNow, delay);
+    }
+    
+    function syncPayload(changes) {
+        return JSON.stringify({
+            client_id: syncClientId,
+            client_now: Date.now(),
+            cursor: syncCursor,
+            book_id: parseInt(bookId),
+            changes: changes
+        });
+    }
+    
+    function syncNow() {
+        if (!bookId) return Promise.resolve();
+        // 上一次同步完成后再提交，保证游标按顺序前进
+        if (syncing) return syncing.then(syncNow);
+        clearTimeout(syncTimer);
+        const changes = syncQueue;
+        syncQueue = [];
+        
+        syncing = fetch('/api/sync', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: syncPayload(changes)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                console.error('同步失败:', data.message);
+                return data;
+            }
+            syncCursor = data.cursor;
+            data.progress.forEach(applyRemoteProgress);
+            data.bookmarks.forEach(applyRemoteBookmark);
+            renderBookmarks();
+            return data;
+        })
+        .catch(error => {
+            // 网络错误时放回队列，下次同步重试
+            syncQueue = changes.concat(syncQueue);
+            console.error('Error syncing:', error);
+        })
+        .finally(() => {
+            syncing = null;
+            if (syncQueue.length) scheduleSync(SYNC_DEBOUNCE_MS);
+        });
+        return syncing;
+    }
+    
+    function applyRemoteProgress(progress) {
+        if (String(progress.book_id) !== String(bookId) || progress.position === currentPosition) return;
+        // 记下其他设备的进度，回到页面时再跳转，避免打断正在进行的阅读
+        remotePosition = progress.position;
+    }
+    
+    function applyRemoteBookmark(bookmark) {
+        if (String(bookmark.book_id) !== String(bookId)) return;
+        if (bookmark.deleted) {
+            bookmarks.delete(bookmark.id);
+        } else {
+            bookmarks.set(bookmark.id, bookmark);
+        }
+    }
+    
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible' && bookId) {
+            syncNow().then(() => {
+                if (remotePosition !== null && remotePosition !== currentPosition) {
+                    changePage(remotePosition);
+                }
+                remotePosition = null;
+            });
+        }
+    });
+    
     // 添加书签功能
     if (bookmarkBtn && bookId) {
         bookmarkBtn.addEventListener('click', function() {
             const title = prompt('请输入书签标题:');
             if (title) {
-                const formData = new FormData();
-                formData.append('book_id', bookId);
-                formData.append('position', currentPosition);
-                formData.append('title', title);
-                
-                fetch('/add_bookmark', {
-                    method: 'POST',
-                    body: formData
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
+                // 请求失败重试时服务器按 client_key 去重，不会重复创建
+                queueChange({
+                    type: 'add_bookmark',
+                    book_id: parseInt(bookId),
+                    position: currentPosition,
+                    title: title,
+                    client_key: `${syncClientId}-${++bookmarkSeq}`
+                });
+                syncNow().then(data => {
+                    if (data && data.success) {
                         alert('书签添加成功!');
-                        // 刷新书签列表
-                        loadBookmarks();
                     } else {
-                        alert('添加书签失败: ' + data.message);
+                        alert('添加书签失败: ' + (data ? data.message : '网络错误'));
                     }
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('添加书签时出错');
                 });
             }
         });
     }
     
-    // 加载书签
-    function loadBookmarks() {
-        if (!bookId) return;
+    // 渲染书签列表
+    function renderBookmarks() {
+        const bookmarkList = document.getElementById('bookmark-list');
+        if (!bookmarkList) return;
         
-        fetch(`/bookmarks/${bookId}`)
-        .then(response => response.json())
-        .then(bookmarks => {
-            const bookmarkList = document.getElementById('bookmark-list');
-            if (!bookmarkList) return;
-            
-            bookmarkList.innerHTML = '';
-            
-            if (bookmarks.length === 0) {
-                bookmarkList.innerHTML = '<li class="bookmark-item">没有书签</li>';
-                return;
-            }
-            
-            bookmarks.forEach(bookmark => {
+        bookmarkList.innerHTML = '';
+        
+        if (bookmarks.size === 0) {
+            bookmarkList.innerHTML = '<li class="bookmark-item">没有书签</li>';
+            return;
+        }
+        
+        Array.from(bookmarks.values())
+            .sort((a, b) => a.position - b.position)
+            .forEach(bookmark => {
                 const li = document.createElement('li');
                 li.className = 'bookmark-item';
-                li.innerHTML = `
-                    <div class="bookmark-title">${bookmark.title}</div>
-                    <div class="bookmark-position">位置: ${bookmark.position + 1}</div>
-                `;
+                const title = document.createElement('div');
+                title.className = 'bookmark-title';
+                title.textContent = bookmark.title;
+                const position = document.createElement('div');
+                position.className = 'bookmark-position';
+                position.textContent = `位置: ${bookmark.position + 1}`;
+                const remove = document.createElement('span');
+                remove.className = 'bookmark-delete';
+                remove.title = '删除书签';
+                remove.textContent = '×';
+                remove.addEventListener('click', function(event) {
+                    event.stopPropagation();
+                    bookmarks.delete(bookmark.id);
+                    renderBookmarks();
+                    queueChange({type: 'delete_bookmark', id: bookmark.id});
+                    syncNow();
+                });
+                position.appendChild(remove);
+                li.appendChild(title);
+                li.appendChild(position);
                 li.addEventListener('click', function() {
                     // 跳转到书签位置
-                    window.location.href = `/read/${bookId}?position=${bookmark.position}`;
+                    window.location.href = `/read/${bookId}/${bookmark.position}`;
                 });
                 bookmarkList.appendChild(li);
             });
-        })
-        .catch(error => {
-            console.error('Error:', error);
-        });
     }
     
-    // 初始加载书签
-    loadBookmarks();
+    // 首次同步取回本书的书签和其他设备的进度
+    syncNow();
+    
+    function queueProgress() {
+        queueChange({
+            type: 'progress',
+            book_id: parseInt(bookId),
+            position: currentPosition,
+            client_time: Date.now()
+        });
+    }
     
-    // 保存阅读进度
+    // 保存阅读进度，短时间内连续翻页只提交一次
     function saveProgress() {
         if (!bookId) return;
-        
-        const formData = new FormData();
-        formData.append('book_id', bookId);
-        formData.append('position', currentPosition);
-        
-        fetch('/save_progress', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => response.json())
-        .then(data => {
-            console.log('Progress saved:', data);
-        })
-        .catch(error => {
-            console.error('Error saving progress:', error);
-        });
+        queueProgress();
+        remotePosition = null;
+        scheduleSync(SYNC_DEBOUNCE_MS);
     }
     
-    // 每30秒保存一次阅读进度
-    setInterval(saveProgress, 30000);
+    // 定期同步，取回其他设备的变化；页面可见时同时提交当前进度，
+    // 长时间停留在同一页的阅读时间也会计入阅读统计（相邻进度间隔不超过 READING_SESSION_GAP）
+    setInterval(function() {
+        if (bookId && document.visibilityState === 'visible') {
+            queueProgress();
+        }
+        syncNow();
+    }, SYNC_INTERVAL_MS);
+    
+    // 页面关闭前提交尚未同步的修改
+    window.addEventListener('pagehide', function() {
+        if (!bookId || !syncQueue.length) return;
+        navigator.sendBeacon('/api/sync', new Blob([syncPayload(syncQueue)], {type: 'application/json'}));
+        syncQueue = [];
+    });
     
-    // 页面关闭前保存进度
-    window.addEventListener('beforeunload', saveProgress);
+    // 其他会话的进度和书签变化由服务器推送
+    if (bookId && window.EventSource) {
+        const stream = new EventSource(`/api/sync/stream?client_id=${syncClientId}`);
+        stream.addEventListener('progress', function(event) {
+            applyRemoteProgress(JSON.parse(event.data));
+        });
+        stream.addEventListener('bookmark', function(event) {
+            applyRemoteBookmark(JSON.parse(event.data));
+            renderBookmarks();
+        });
+    }
     
     // 翻页功能
     if (prevPageBtn) {
@@ -587,10 +709,93 @@ async function fetchData() {
         });
     }
     
+    // 预取从指定位置开始的若干页
+    function prefetchPages(from) {
+        if (!bookId || from < 0 || prefetchingFrom === from) return;
+        prefetchingFrom = from;
+        
+        fetch(`/api/books/${bookId}/pages?from=${from}&count=${PAGE_PREFETCH_COUNT}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) return;
+            data.pages.forEach(page => {
+                pageCache.set(page.position, {
+                    success: true,
+                    content: page.content,
+                    position: page.position,
+                    total_positions: data.total_positions
+                });
+            });
+            // 限制缓存大小，先淘汰最早加入的页面
+            while (pageCache.size > PAGE_CACHE_LIMIT) {
+                pageCache.delete(pageCache.keys().next().value);
+            }
+        })
+        .catch(error => {
+            console.error('预取页面失败:', error);
+        })
+        .finally(() => {
+            prefetchingFrom = null;
+        });
+    }
+    
+    // 显示一页内容
+    function renderPage(data) {
+        // 更新内容
+        if (readerContent) {
+            readerContent.innerHTML = data.content;
+        }
+        
+        // 更新当前位置
+        currentPosition = data.position;
+        markActivePosition(currentPosition);
+        
+        // 更新页码指示器
+        if (pageIndicator) {
+            pageIndicator.textContent = `${data.position + 1} / ${data.total_positions}`;
+        }
+        
+        // 更新按钮状态和位置
+        if (prevPageBtn) {
+            if (data.position > 0) {
+                prevPageBtn.disabled = false;
+                prevPageBtn.setAttribute('data-position', data.position - 1);
+            } else {
+                prevPageBtn.disabled = true;
+            }
+        }
+        
+        if (nextPageBtn) {
+            if (data.position < data.total_positions - 1) {
+                nextPageBtn.disabled = false;
+                nextPageBtn.setAttribute('data-position', data.position + 1);
+            } else {
+                nextPageBtn.disabled = true;
+            }
+        }
+        
+        // 保存阅读进度
+        saveProgress();
+        
+        // 更新URL，但不刷新页面
+        window.history.pushState({}, '', `/read/${bookId}/${data.position}`);
+        
+        // 下一页不在缓存中时提前预取
+        if (data.position < data.total_positions - 1 && !pageCache.has(data.position + 1)) {
+            prefetchPages(data.position + 1);
+        }
+    }
+    
     // 页面切换函数
     function changePage(position) {
         if (!bookId) return;
         
+        const cached = pageCache.get(position);
+        if (cached) {
+            renderPage(cached);
+            return;
+        }
+        
         fetch(`/read/${bookId}/${position}`, {
             method: 'GET',
             headers: {
@@ -605,43 +810,7 @@ async function fetchData() {
         })
         .then(data => {
             if (data.success) {
-                // 更新内容
-                if (readerContent) {
-                    readerContent.innerHTML = data.content;
-                }
-                
-                // 更新当前位置
-                currentPosition = data.position;
-                
-                // 更新页码指示器
-                if (pageIndicator) {
-                    pageIndicator.textContent = `${data.position + 1} / ${data.total_positions}`;
-                }
-                
-                // 更新按钮状态和位置
-                if (prevPageBtn) {
-                    if (data.position > 0) {
-                        prevPageBtn.disabled = false;
-                        prevPageBtn.setAttribute('data-position', data.position - 1);
-                    } else {
-                        prevPageBtn.disabled = true;
-                    }
-                }
-                
-                if (nextPageBtn) {
-                    if (data.position < data.total_positions - 1) {
-                        nextPageBtn.disabled = false;
-                        nextPageBtn.setAttribute('data-position', data.position + 1);
-                    } else {
-                        nextPageBtn.disabled = true;
-                    }
-                }
-                
-                // 保存阅读进度
-                saveProgress();
-                
-                // 更新URL，但不刷新页面
-                window.history.pushState({}, '', `/read/${bookId}/${data.position}`);
+                renderPage(data);
             } else if (data.error) {
                 console.error('加载页面时出错:', data.error);
                 alert('加载页面时出错: ' + data.error);
@@ -656,6 +825,20 @@ async function fetchData() {
         });
     }
     
+    // 目录和缩略图随页面外壳缓存，当前位置的高亮在客户端设置
+    function markActivePosition(position) {
+        document.querySelectorAll('.toc-item[data-position], .thumbnail[data-position]').forEach(item => {
+            item.classList.toggle('active', parseInt(item.getAttribute('data-position')) === position);
+        });
+    }
+    
+    markActivePosition(currentPosition);
+    
+    // 打开页面后预取后续页面
+    if (nextPageBtn && !nextPageBtn.disabled) {
+        prefetchPages(currentPosition + 1);
+    }
+    
     // 便携模式功能
     if (portableModeBtn) {
         portableModeBtn.addEventListener('click', function() {
@@ -0,0 +1,89 @@
+import os
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows只在进程内加锁
+    fcntl = None
+
+# 按内容哈希存放书籍文件的子目录
+OBJECTS_DIR = 'objects'
+
+# 每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 存储目录中的锁文件，多个工作进程之间互斥
+LOCK_FILE = '.lock'
+
+_thread_lock = threading.Lock()
+
+
+def object_path(upload_folder, digest, ext):
+    """内容哈希对应的存储路径，按前两位分目录"""
+    return os.path.join(upload_folder, OBJECTS_DIR, digest[:2], digest + ext)
+
+
+@contextmanager
+def object_lock(upload_folder):
+    """存放或删除书籍文件时持有的锁，跨线程和进程
+
+    存放文件与提交引用它的书籍记录、检查引用与删除文件都在锁内完成，
+    相同内容的上传不会引用一个随后被删除的文件。锁内先于其他数据库写入获取，避免与数据库锁互相等待。
+    """
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        folder = os.path.join(upload_folder, OBJECTS_DIR)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def stage_upload(stream, upload_folder):
+    """分块写入上传的文件并计算SHA-256，返回 (临时文件路径, 哈希值)"""
+    tmp_dir = os.path.join(upload_folder, OBJECTS_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, sha256.hexdigest()
+
+
+def store_staged(tmp_path, upload_folder, digest, ext):
+    """把暂存的文件放入内容寻址存储，返回存储路径，需在 object_lock 内调用
+
+    相同内容的文件只保存一份，已存在时丢弃暂存文件。
+    """
+    path = object_path(upload_folder, digest, ext)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def remove_staged(tmp_path):
+    """删除暂存文件，已放入存储或已删除时忽略"""
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
@@ -0,0 +1,317 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Book, Bookmark, ReadingProgress
+from progress_buffer import progress_buffer
+
+# 按游标查询变化时向前多取的时间，覆盖并发事务中提交稍晚的记录；客户端按id合并，重复返回没有影响
+CURSOR_OVERLAP = timedelta(seconds=2)
+
+# 单次同步最多接受的修改数
+MAX_CHANGES = 200
+
+# 客户端书签标识的最大长度，与 Bookmark.client_key 一致
+MAX_CLIENT_KEY = 64
+
+
+def encode_cursor(value):
+    return value.isoformat()
+
+
+def decode_cursor(cursor):
+    """解析同步游标，无效时抛出ValueError"""
+    try:
+        return datetime.fromisoformat(cursor)
+    except (TypeError, ValueError):
+        raise ValueError('无效的同步游标')
+
+
+def _from_millis(value):
+    try:
+        return datetime.utcfromtimestamp(float(value) / 1000)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('无效的客户端时间')
+
+
+def _is_id(value):
+    """JSON中的整数；bool是int的子类，需要单独排除"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _client_time(value, now, offset):
+    """客户端时间（毫秒时间戳）按时钟偏差换算为服务器时间，晚于服务器当前时间的按当前时间处理"""
+    if value is None:
+        return now
+    return min(_from_millis(value) + offset, now)
+
+
+def bookmark_dict(bookmark):
+    if bookmark.deleted:
+        return {'id': bookmark.id, 'book_id': bookmark.book_id, 'deleted': True}
+    return {
+        'id': bookmark.id,
+        'book_id': bookmark.book_id,
+        'title': bookmark.title,
+        'position': bookmark.position,
+        'created_at': bookmark.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'deleted': False,
+    }
+
+
+def apply_changes(user_id, changes, client_now=None, source=None):
+    """应用客户端提交的一批修改，返回每条修改的处理结果，需在应用上下文中调用
+
+    修改类型：
+      {'type': 'progress', 'book_id', 'position', 'client_time'}
+      {'type': 'add_bookmark', 'book_id', 'position', 'title', 'client_key'}
+      {'type': 'delete_bookmark', 'id'}
+    client_now 为客户端发送请求时的时间，用于换算客户端与服务器的时钟偏差。
+    同一本书的多条进度只保留客户端时间最新的一条；早于服务器已有进度的修改视为过期，不会覆盖。
+    带 client_key 的书签按 (用户, client_key) 只创建一次，重试时返回已创建书签的id。
+    格式错误时抛出ValueError，不应用任何修改。
+    """
+    if not isinstance(changes, list) or len(changes) > MAX_CHANGES:
+        raise ValueError('修改列表无效')
+    now = datetime.utcnow()
+    offset = now - _from_millis(client_now) if client_now is not None else timedelta(0)
+
+    progress, added, deleted = {}, [], []
+    results = [None] * len(changes)
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict):
+            raise ValueError('修改格式无效')
+        kind = change.get('type')
+        if kind == 'progress':
+            book_id, position = change.get('book_id'), change.get('position')
+            if not _is_id(book_id) or not _is_id(position) or position < 0:
+                raise ValueError('进度参数无效')
+            client_time = _client_time(change.get('client_time'), now, offset)
+            previous = progress.get(book_id)
+            if previous is not None:
+                if previous[2] > client_time:
+                    results[index] = {'status': 'stale'}
+                    continue
+                results[previous[0]] = {'status': 'stale'}
+            progress[book_id] = (index, position, client_time)
+        elif kind == 'add_bookmark':
+            book_id, position = change.get('book_id'), change.get('position')
+            client_key = change.get('client_key')
+            if not _is_id(book_id) or not _is_id(position) or position < 0 or not (
+                    client_key is None or isinstance(client_key, str) and 0 < len(client_key) <= MAX_CLIENT_KEY):
+                raise ValueError('书签参数无效')
+            added.append((index, book_id, position, str(change.get('title') or '')[:200], client_key))
+        elif kind == 'delete_bookmark':
+            if not _is_id(change.get('id')):
+                raise ValueError('书签参数无效')
+            deleted.append((index, change['id']))
+        else:
+            raise ValueError('未知的修改类型')
+
+    # 一次查询确认涉及的书籍都属于当前用户
+    book_ids = set(progress) | {item[1] for item in added}
+    owned = set()
+    if book_ids:
+        owned = {row[0] for row in db.session.query(Book.id)
+                 .filter(Book.id.in_(book_ids), Book.user_id == user_id)}
+
+    if progress:
+        saved = dict(db.session.query(ReadingProgress.book_id, ReadingProgress.updated_at)
+                     .filter(ReadingProgress.user_id == user_id,
+                             ReadingProgress.book_id.in_(progress)))
+        for book_id, (_, saved_at) in progress_buffer.pending_for_user(user_id).items():
+            saved[book_id] = saved_at
+        for book_id, (index, position, client_time) in progress.items():
+            if book_id not in owned:
+                results[index] = {'status': 'forbidden'}
+            elif saved.get(book_id) is not None and saved[book_id] > client_time:
+                results[index] = {'status': 'stale'}
+            else:
+                progress_buffer.add(user_id, book_id, position)
+                results[index] = {'status': 'ok'}
+                sync_hub.publish(user_id, 'progress', {
+                    'book_id': book_id, 'position': position, 'updated_at': now.isoformat()
+                }, source=source)
+
+    try:
+        bookmarks = _apply_bookmarks(user_id, added, deleted, owned, results)
+    except IntegrityError:
+        # 并发提交的同一批书签已由另一个请求写入，重新查询后返回其结果
+        db.session.rollback()
+        bookmarks = _apply_bookmarks(user_id, added, deleted, owned, results)
+    for index, bookmark, created in bookmarks:
+        results[index] = {'status': 'ok', 'id': bookmark.id}
+        if created:
+            sync_hub.publish(user_id, 'bookmark', bookmark_dict(bookmark), source=source)
+
+    for index, change in enumerate(changes):
+        if change.get('client_key') is not None and results[index] is not None:
+            results[index]['client_key'] = change['client_key']
+    return results
+
+
+def _apply_bookmarks(user_id, added, deleted, owned, results):
+    """创建和删除书签并提交，返回 [(修改序号, 书签, 是否本次修改)]"""
+    keys = {item[4] for item in added if item[4] is not None}
+    existing = {}
+    if keys:
+        existing = {b.client_key: b for b in Bookmark.query.filter(
+            Bookmark.user_id == user_id, Bookmark.client_key.in_(keys))}
+
+    bookmarks = []
+    for index, book_id, position, title, client_key in added:
+        if book_id not in owned:
+            results[index] = {'status': 'forbidden'}
+            continue
+        bookmark = existing.get(client_key)
+        if bookmark is not None:
+            bookmarks.append((index, bookmark, False))
+            continue
+        bookmark = Bookmark(user_id=user_id, book_id=book_id, position=position, title=title,
+                            client_key=client_key)
+        db.session.add(bookmark)
+        if client_key is not None:
+            existing[client_key] = bookmark
+        bookmarks.append((index, bookmark, True))
+    if deleted:
+        rows = {b.id: b for b in Bookmark.query.filter(
+            Bookmark.id.in_([bookmark_id for _, bookmark_id in deleted]),
+            Bookmark.user_id == user_id)}
+        for index, bookmark_id in deleted:
+            bookmark = rows.get(bookmark_id)
+            if bookmark is None:
+                results[index] = {'status': 'not_found'}
+                continue
+            bookmark.deleted = True
+            bookmarks.append((index, bookmark, True))
+    if bookmarks:
+        db.session.commit()
+    return bookmarks
+
+
+def get_changes(user_id, since=None, book_id=None):
+    """返回 since 之后变化的阅读进度和书签，以及下一次同步使用的游标
+
+    没有游标时返回全部进度和未删除的书签；有游标时同时返回已删除书签的id，
+    尚未写入数据库的进度优先于数据库中的记录。
+    """
+    now = datetime.utcnow()
+    progress_query = db.session.query(ReadingProgress.book_id, ReadingProgress.position,
+                                      ReadingProgress.updated_at) \
+        .filter(ReadingProgress.user_id == user_id)
+    bookmark_query = Bookmark.query.filter(Bookmark.user_id == user_id)
+    if book_id is not None:
+        progress_query = progress_query.filter(ReadingProgress.book_id == book_id)
+        bookmark_query = bookmark_query.filter(Bookmark.book_id == book_id)
+    if since is None:
+        bookmark_query = bookmark_query.filter(Bookmark.deleted.is_(False))
+    else:
+        since = since - CURSOR_OVERLAP
+        progress_query = progress_query.filter(ReadingProgress.updated_at > since)
+        bookmark_query = bookmark_query.filter(Bookmark.updated_at > since)
+
+    progress = {row.book_id: (row.position, row.updated_at) for row in progress_query}
+    for pending_book_id, item in progress_buffer.pending_for_user(user_id).items():
+        if book_id is not None and pending_book_id != book_id:
+            continue
+        if since is None or item[1] > since:
+            progress[pending_book_id] = item
+
+    return {
+        'cursor': encode_cursor(now),
+        'progress': [
+            {'book_id': key, 'position': position,
+             'updated_at': updated_at.isoformat() if updated_at else None}
+            for key, (position, updated_at) in progress.items()
+        ],
+        'bookmarks': [bookmark_dict(b) for b in bookmark_query.order_by(Bookmark.id)],
+    }
+
+
+class SyncHub:
+    """把阅读进度和书签的变化推送给同一用户的其他阅读会话（Server-Sent Events）
+
+    订阅只在本进程内有效；连接到其他工作进程的会话在下一次 /api/sync 时取得变化。
+    每个连接最多保持 stream_timeout 秒，浏览器的EventSource会自动重连，
+    避免长期占用工作线程；队列已满时丢弃事件，客户端同步时会补齐。
+    """
+
+    def __init__(self, app=None):
+        self.heartbeat = 15.0
+        self.stream_timeout = 300.0
+        self.queue_size = 100
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.heartbeat = app.config.get('SYNC_HEARTBEAT', self.heartbeat)
+        self.stream_timeout = app.config.get('SYNC_STREAM_TIMEOUT', self.stream_timeout)
+        self.queue_size = app.config.get('SYNC_QUEUE_SIZE', self.queue_size)
+
+    @property
+    def enabled(self):
+        return self.stream_timeout > 0
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event, data, source=None):
+        """向该用户的所有连接发送事件，source 为发起修改的客户端，它自己不会收到"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data, source))
+                self.published += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def stream(self, user_id, client_id=None):
+        """返回SSE响应内容的生成器，空闲时定期发送注释行保持连接"""
+        q = self.subscribe(user_id)
+
+        def generate():
+            try:
+                yield f'retry: {int(self.heartbeat * 1000)}\n\n'
+                deadline = time.monotonic() + self.stream_timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event, data, source = q.get(timeout=min(self.heartbeat, remaining))
+                    except queue.Empty:
+                        yield ': ping\n\n'
+                        continue
+                    if client_id is not None and source == client_id:
+                        continue
+                    yield f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+            finally:
+                self.unsubscribe(user_id, q)
+
+        return generate()
+
+    def stats(self):
+        with self._lock:
+            connections = sum(len(s) for s in self._subscribers.values())
+        return {'connections': connections, 'published': self.published, 'dropped': self.dropped}
+
+
+sync_hub = SyncHub()
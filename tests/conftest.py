@@ -0,0 +1,17 @@
+import importlib
+import os
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """在临时目录中导入应用，数据库和派生数据都写在临时目录"""
+    root = tmp_path_factory.mktemp('reader')
+    os.environ['UPLOAD_FOLDER'] = str(root / 'uploads')
+    os.environ['DATABASE_URI'] = f"sqlite:///{root / 'reader.db'}"
+    os.environ['STATS_ROLLUP_INTERVAL'] = '0'
+    os.environ['SYNC_STREAM_TIMEOUT'] = '0'
+    os.makedirs(os.environ['UPLOAD_FOLDER'], exist_ok=True)
+    module = importlib.import_module('app')
+    module.app.config['TESTING'] = True
+    return module.app
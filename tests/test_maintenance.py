@@ -0,0 +1,58 @@
+import os
+import threading
+import pytest
+
+PyPDF2 = pytest.importorskip('PyPDF2')
+pytest.importorskip('flask_sqlalchemy')
+
+import maintenance  # noqa: E402
+from book_handlers import PAGE_SCHEME  # noqa: E402
+from models import db, User, Book  # noqa: E402
+
+
+def _write_pdf(path, pages):
+    writer = PyPDF2.PdfFileWriter()
+    for _ in range(pages):
+        writer.addBlankPage(width=200, height=200)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def test_rebuild_with_pdf_finishes(app):
+    folder = app.config['UPLOAD_FOLDER']
+    pdf_path = os.path.join(folder, 'three.pdf')
+    txt_path = os.path.join(folder, 'one.txt')
+    _write_pdf(pdf_path, 3)
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.write('第一行\n第二行\n')
+
+    with app.app_context():
+        user = User(username='maintenance')
+        db.session.add(user)
+        db.session.commit()
+        for title, path, ext in (('three', pdf_path, '.pdf'), ('one', txt_path, '.txt')):
+            db.session.add(Book(title=title, file_path=path, file_format=ext, user_id=user.id))
+        db.session.commit()
+        user_id = user.id
+
+    result = {}
+
+    def target():
+        with app.app_context():
+            result['counts'] = maintenance.run(app, maintenance.MODE_REBUILD, user_id=user_id,
+                                               workers=2, echo=lambda line: None)
+
+    # 工作进程中残留的PDF进程池会让进程池退出时一直等待
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=120)
+    assert not thread.is_alive(), 'maintenance.run did not return'
+
+    counts = result['counts']
+    assert counts.get(maintenance.FAILED, 0) == 0
+    assert counts.get(maintenance.BUILT, 0) > 0
+    with app.app_context():
+        book = Book.query.filter_by(file_path=pdf_path).one()
+        assert book.total_positions == 3
+        assert book.status == Book.STATUS_READY
+        assert book.page_scheme == PAGE_SCHEME
@@ -0,0 +1,36 @@
+import txt_index
+from txt_index import TxtIndex, build_index
+
+
+def _pages(path, lines_per_page=100, max_bytes=4096):
+    index = TxtIndex(str(path), lines_per_page, max_bytes)
+    try:
+        return [index.page(p) for p in range(index.page_count)], index.offsets
+    finally:
+        index.close()
+
+
+def test_long_run_of_continuation_bytes(tmp_path):
+    path = tmp_path / 'invalid.txt'
+    path.write_bytes(b'\x80' * 40000)
+    offsets, _ = build_index(str(path), 100, 4096)
+    assert offsets[0] == 0 and offsets[-1] == 40000
+    assert all(b > a for a, b in zip(offsets, offsets[1:]))
+    assert all(b - a <= 4096 for a, b in zip(offsets, offsets[1:]))
+
+
+def test_non_utf8_text(tmp_path):
+    path = tmp_path / 'gbk.txt'
+    path.write_bytes(('中文内容' * 5000).encode('gbk'))
+    pages, offsets = _pages(path, max_bytes=1000)
+    assert offsets[-1] == path.stat().st_size
+    assert len(pages) == len(offsets) - 1
+
+
+def test_utf8_split_keeps_characters(tmp_path):
+    path = tmp_path / 'utf8.txt'
+    text = '汉字' * 3000
+    path.write_text(text, encoding='utf-8')
+    pages, _ = _pages(path, max_bytes=1001)
+    assert ''.join(pages) == text
+    txt_index.remove_index(str(path))
@@ -0,0 +1,150 @@
+import os
+import mmap
+import threading
+import struct
+from array import array
+
+# 索引文件后缀，与书籍文件放在同一目录
+INDEX_SUFFIX = '.idx'
+
+# 文件头：魔数、版本、源文件mtime、源文件大小、每页行数、每页字节上限、页数、旧分页页数
+_MAGIC = b'TXTIDX'
+_VERSION = 2
+_HEADER = struct.Struct('<6sHqQIIII')
+
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+# UTF-8字符最多4个字节，向前最多跳过3个后续字节
+_MAX_CONTINUATION = 3
+
+
+def _char_boundary(data, index):
+    """向前调整到UTF-8字符边界，避免把一个字拆到两页
+
+    最多回退3个字节；非UTF-8内容中连续的后续字节不构成字符，直接在原位置拆开。
+    """
+    lower = max(index - _MAX_CONTINUATION, 0)
+    boundary = index
+    while boundary > lower and (data[boundary] & 0xC0) == 0x80:
+        boundary -= 1
+    if (data[boundary] & 0xC0) == 0x80:
+        return index
+    return boundary
+
+
+def build_index(file_path, lines_per_page, max_bytes):
+    """扫描一遍TXT文件，记录每页起始字节偏移并写入索引文件
+
+    每页最多 lines_per_page 行且不超过 max_bytes 字节，在行边界分页；
+    单行超过上限时在字符边界处拆开。同时记录旧分页（每页固定行数）
+    每页起始行所在的新页码，用于转换已保存的进度和书签。
+    """
+    st = os.stat(file_path)
+    offsets = array('Q', [0])
+    legacy = array('Q')
+    offset = 0
+    page_start = 0
+    page_lines = 0
+    line_count = 0
+    with open(file_path, 'rb') as f:
+        for line in f:
+            if page_lines and (page_lines >= lines_per_page
+                               or offset + len(line) - page_start > max_bytes):
+                offsets.append(offset)
+                page_start = offset
+                page_lines = 0
+            if line_count % lines_per_page == 0:
+                legacy.append(len(offsets) - 1)
+            # 超长的行拆成多页
+            cut = 0
+            while len(line) - cut > max_bytes:
+                boundary = _char_boundary(line, cut + max_bytes)
+                # 每一步至少前进一个字节
+                cut = boundary if boundary > cut else cut + max_bytes
+                offsets.append(offset + cut)
+                page_start = offset + cut
+            offset += len(line)
+            page_lines += 1
+            line_count += 1
+    # 补上最后一页的结尾
+    if offsets[-1] != offset:
+        offsets.append(offset)
+
+    page_count = len(offsets) - 1
+    # 先写临时文件再原子替换，避免并发读取到半成品
+    tmp_path = f'{index_path(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, st.st_mtime_ns, st.st_size,
+                             lines_per_page, max_bytes, page_count, len(legacy)))
+        offsets.tofile(f)
+        legacy.tofile(f)
+    os.replace(tmp_path, index_path(file_path))
+    return offsets, legacy
+
+
+def _read_index(file_path, lines_per_page, max_bytes):
+    """读取索引文件，文件缺失或与源文件不一致时返回None"""
+    try:
+        with open(index_path(file_path), 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                return None
+            magic, version, mtime_ns, size, lpp, page_bytes, page_count, legacy_count = _HEADER.unpack(header)
+            st = os.stat(file_path)
+            if (magic != _MAGIC or version != _VERSION or lpp != lines_per_page
+                    or page_bytes != max_bytes
+                    or mtime_ns != st.st_mtime_ns or size != st.st_size):
+                return None
+            offsets = array('Q')
+            offsets.fromfile(f, page_count + 1)
+            legacy = array('Q')
+            legacy.fromfile(f, legacy_count)
+            return offsets, legacy
+    except (OSError, EOFError, struct.error):
+        return None
+
+
+def remove_index(file_path):
+    try:
+        os.remove(index_path(file_path))
+    except OSError:
+        pass
+
+
+class TxtIndex:
+    """基于偏移索引和mmap的TXT分页读取器"""
+
+    def __init__(self, file_path, lines_per_page, max_bytes):
+        index = _read_index(file_path, lines_per_page, max_bytes)
+        if index is None:
+            index = build_index(file_path, lines_per_page, max_bytes)
+        self.offsets, self.legacy = index
+        self._file = open(file_path, 'rb')
+        # 空文件无法mmap
+        self._map = None
+        if self.offsets[-1] > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def page_count(self):
+        return len(self.offsets) - 1
+
+    def page(self, position):
+        """只解码指定页对应的字节"""
+        if self._map is None or not 0 <= position < self.page_count:
+            return ''
+        data = self._map[self.offsets[position]:self.offsets[position + 1]]
+        text = data.decode('utf-8', errors='ignore')
+        # 与文本模式读取保持一致的换行符
+        return text.replace('\r\n', '\n')
+
+    def nbytes(self):
+        return self.offsets.itemsize * (len(self.offsets) + len(self.legacy))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
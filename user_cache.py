@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import db, User
+
+
+class CachedUser(UserMixin):
+    """缓存中的轻量用户，只包含请求中用到的字段，不绑定数据库会话"""
+
+    def __init__(self, id, username, theme_preference):
+        self.id = id
+        self.username = username
+        self.theme_preference = theme_preference
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserCache:
+    """load_user 前的用户缓存，按过期时间和条目数淘汰
+
+    用户资料或密码修改时由SQLAlchemy事件清除本进程中的条目；
+    其他工作进程中的条目最多在 ttl 秒后过期。
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300.0
+        self.max_entries = 1024
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.get('USER_CACHE_SIZE', self.max_entries)
+        if not event.contains(User, 'after_update', self._on_change):
+            event.listen(User, 'after_update', self._on_change)
+            event.listen(User, 'after_delete', self._on_change)
+            event.listen(Session, 'after_commit', self._on_commit)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, user_id):
+        """返回缓存的用户，未命中时只查询需要的字段，用户不存在时返回None"""
+        if self.enabled:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+
+        row = db.session.query(User.id, User.username, User.theme_preference) \
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        if self.enabled:
+            with self._lock:
+                self._entries[user_id] = (user, time.monotonic() + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _on_change(self, mapper, connection, target):
+        # 提交前后各清除一次，避免提交前有请求把旧数据重新放入缓存
+        self.invalidate(target.id)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('changed_users', set()).add(target.id)
+
+    def _on_commit(self, session):
+        for user_id in session.info.pop('changed_users', ()):
+            self.invalidate(user_id)
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+user_cache = UserCache()